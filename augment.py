@@ -0,0 +1,103 @@
+"""Masking augmentation for MAGE training, generated on the batch's device.
+
+``MaskAugment`` replaces ``inputs * generate_mask(...).to(device)``: the
+uniform noise is drawn straight into a buffer that lives on the inputs'
+device and is reused every step, then thresholded in place. ``mode='pixel'``
+is the original per-pixel mask; ``mode='block'`` draws one value per
+``block_size x block_size`` patch. As in ``generate_mask``, a position is
+kept where its draw is below ``mask_ratio``.
+
+    python augment.py --device cpu --batch-sizes 64 256
+
+times the old path against both modes per training step.
+"""
+
+import argparse
+
+import torch
+
+from models import generate_mask
+
+
+class MaskAugment:
+    """Multiplies a batch by a random pixel or block mask drawn on the batch's device.
+
+    With ``seed`` the masks come from a private generator and are
+    reproducible; without it they come from the global RNG, which on CPU
+    yields exactly the masks ``generate_mask`` would have drawn.
+    """
+
+    def __init__(self, mask_ratio=0.2, mode='pixel', block_size=4, seed=None):
+        if mode not in ('pixel', 'block'):
+            raise ValueError('Unknown mask mode: {}'.format(mode))
+        self.mask_ratio = mask_ratio
+        self.mode = mode
+        self.block_size = block_size
+        self.seed = seed
+        self._generator = None
+        self._buffer = None
+
+    def _noise(self, shape, device):
+        if self.seed is not None and (self._generator is None or self._generator.device != device):
+            self._generator = torch.Generator(device=device).manual_seed(self.seed)
+        buffer = self._buffer
+        # Grow only; smaller (e.g. last) batches use a leading slice
+        if buffer is None or buffer.device != device or buffer.shape[0] < shape[0] or buffer.shape[1:] != shape[1:]:
+            buffer = self._buffer = torch.empty(shape, device=device)
+        noise = buffer[:shape[0]]
+        return torch.rand(noise.shape, out=noise, generator=self._generator)
+
+    def mask(self, inputs):
+        """0/1 float mask for ``inputs`` (``[B, 1, H, W]``, or ``[B, 1, H/b, 1, W/b, 1]`` in block mode).
+
+        The tensor is a view of the reused buffer and is overwritten by the
+        next call.
+        """
+        batch_size, _, height, width = inputs.shape
+        if self.mode == 'pixel':
+            noise = self._noise((batch_size, 1, height, width), inputs.device)
+            return noise.lt_(self.mask_ratio)
+        b = self.block_size
+        if height % b or width % b:
+            raise ValueError('block_size {} does not divide a {}x{} input'.format(b, height, width))
+        noise = self._noise((batch_size, 1, height // b, 1, width // b, 1), inputs.device)
+        return noise.lt_(self.mask_ratio)
+
+    def __call__(self, inputs):
+        mask = self.mask(inputs).to(inputs.dtype)
+        if self.mode == 'pixel':
+            return inputs * mask
+        batch_size, channels, height, width = inputs.shape
+        b = self.block_size
+        # Broadcast each patch value over its block instead of upsampling the mask
+        blocks = inputs.reshape(batch_size, channels, height // b, b, width // b, b)
+        return (blocks * mask).reshape(batch_size, channels, height, width)
+
+
+def _legacy(mask_ratio):
+    def apply(inputs):
+        return inputs * generate_mask(inputs.size(0), inputs.size(-1), mask_ratio).to(inputs.device)
+    return apply
+
+
+if __name__ == '__main__':
+    from benchmark import summarize, time_forward
+
+    parser = argparse.ArgumentParser(description='Per-step overhead of masking augmentation.')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--mask-ratio', type=float, default=0.2)
+    parser.add_argument('--iters', type=int, default=200)
+    args = parser.parse_args()
+
+    variants = [
+        ('generate_mask', _legacy(args.mask_ratio)),
+        ('pixel', MaskAugment(args.mask_ratio, 'pixel', seed=0)),
+        ('block 4x4', MaskAugment(args.mask_ratio, 'block', block_size=4, seed=0)),
+    ]
+    for batch_size in args.batch_sizes:
+        inputs = torch.randn(batch_size, 1, 28, 28, device=args.device)
+        for name, fn in variants:
+            stats = summarize(time_forward(fn, inputs, warmup=20, iters=args.iters), batch_size)
+            print('batch {:5d}  {:<14} p50 {:8.3f}ms  p99 {:8.3f}ms'.format(
+                batch_size, name, stats['p50_ms'], stats['p99_ms']))
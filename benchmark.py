@@ -0,0 +1,327 @@
+"""Inference latency/throughput benchmark for the models in ``models.py``.
+
+For every model it warms up, then times many forward passes with
+``time.perf_counter_ns`` across a sweep of batch sizes and thread counts, and
+reports p50/p95/p99 latency, images/sec and peak RSS. Each model runs in its
+own process so the peak RSS belongs to that model alone. Results are written
+as JSON tagged with the git commit so runs can be diffed:
+
+    python benchmark.py --output bench/HEAD.json --baseline bench/main.json
+
+Variants (``--variants eager fused ...``) time transformed copies of each
+model and record their max output deviation from the eager model.
+
+``--attention`` instead sweeps a single ``SelfAttention`` layer (as ``att1``
+sees it) over input resolutions, batch sizes and tile sizes, reporting
+latency, peak memory and the max deviation from the full-map layer.
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+
+from export import compile_model, trace_for_inference
+from models import MODELS, SelfAttention, max_output_error, set_attention_chunk_size
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+def _eager(model):
+    return model
+
+
+def _tiled(model):
+    return set_attention_chunk_size(model, 64)
+
+
+def _fused(model):
+    return model.fuse_for_inference() if hasattr(model, 'fuse_for_inference') else model
+
+
+def _bf16(model):
+    def forward(inputs):
+        with torch.autocast(inputs.device.type, dtype=torch.bfloat16):
+            return model(inputs)
+    return forward
+
+
+def _channels_last(model):
+    model = model.to(memory_format=torch.channels_last)
+
+    def forward(inputs):
+        return model(inputs.contiguous(memory_format=torch.channels_last))
+    return forward
+
+
+def _traced(model):
+    return trace_for_inference(model)
+
+
+def _compiled(model):
+    # Compiles on first call per input shape, i.e. during warmup
+    return compile_model(model)
+
+
+# Ways of turning an eval-mode model into the callable that gets timed
+VARIANTS = {
+    'eager': _eager,
+    'tiled': _tiled,
+    'fused': _fused,
+    'bf16': _bf16,
+    'channels_last': _channels_last,
+    'traced': _traced,
+    'compiled': _compiled,
+}
+
+
+def _sync(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def time_forward(fn, inputs, warmup=10, iters=100):
+    """Latency of ``fn(inputs)`` in nanoseconds, one entry per timed call."""
+    device = inputs.device
+    samples = []
+    with torch.inference_mode():
+        for _ in range(warmup):
+            fn(inputs)
+        _sync(device)
+        for _ in range(iters):
+            start = time.perf_counter_ns()
+            fn(inputs)
+            _sync(device)
+            samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def percentile(sorted_samples, q):
+    """Linear-interpolated percentile of an already sorted list."""
+    pos = (len(sorted_samples) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (pos - lo)
+
+
+def summarize(samples, batch_size):
+    samples = sorted(samples)
+    p50 = percentile(samples, 50)
+    return {
+        'p50_ms': p50 / 1e6,
+        'p95_ms': percentile(samples, 95) / 1e6,
+        'p99_ms': percentile(samples, 99) / 1e6,
+        'mean_ms': sum(samples) / len(samples) / 1e6,
+        'images_per_sec': batch_size / (p50 / 1e9),
+    }
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident set size."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def benchmark_model(fn, batch_sizes=BATCH_SIZES, thread_counts=(None,), warmup=10, iters=100,
+                    device='cpu', input_size=28):
+    """Sweep ``batch_sizes`` x ``thread_counts``; returns one record per configuration."""
+    device = torch.device(device)
+    records = []
+    for threads in thread_counts:
+        if threads is not None:
+            torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            inputs = torch.randn(batch_size, 1, input_size, input_size, device=device)
+            record = {'batch_size': batch_size, 'threads': torch.get_num_threads()}
+            record.update(summarize(time_forward(fn, inputs, warmup, iters), batch_size))
+            records.append(record)
+    return records
+
+
+def measure_inference_time(model, testloader, device, warmup=10, iters=50):
+    """Median per-image latency on the first test batch, after warmup."""
+    model.eval()
+    inputs, _ = next(iter(testloader))
+    inputs = inputs.to(device)
+    samples = sorted(time_forward(model, inputs, warmup, iters))
+    return percentile(samples, 50) / 1e9 / len(inputs)
+
+
+def _benchmark_worker(model_name, variant, options):
+    torch.manual_seed(0)
+    device = torch.device(options['device'])
+    model = MODELS[model_name]().to(device).eval()
+    fn = VARIANTS[variant](copy.deepcopy(model))
+    error = max_output_error(model, fn, torch.randn(64, 1, 28, 28, device=device))
+    del model
+    records = benchmark_model(fn, options['batch_sizes'], options['thread_counts'],
+                              options['warmup'], options['iters'], device)
+    for record in records:
+        record.update(model=model_name, variant=variant, max_abs_error=error)
+    return records, peak_rss_bytes()
+
+
+def run_suite(model_names, variants=('eager',), batch_sizes=BATCH_SIZES, thread_counts=(None,),
+              warmup=10, iters=100, device='cpu'):
+    """Benchmark every model/variant pair in a fresh process; returns a list of records."""
+    options = {'batch_sizes': list(batch_sizes), 'thread_counts': list(thread_counts),
+               'warmup': warmup, 'iters': iters, 'device': device}
+    context = mp.get_context('spawn')
+    records = []
+    for model_name in model_names:
+        for variant in variants:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results, peak = pool.submit(_benchmark_worker, model_name, variant, options).result()
+            for record in results:
+                record['peak_rss_bytes'] = peak
+            records.extend(results)
+    return records
+
+
+def _attention_worker(resolution, batch_size, chunk_size, options):
+    torch.manual_seed(0)
+    device = torch.device(options['device'])
+    # att1 sits behind one 2x2 pooling step
+    size = resolution // 2
+    layer = SelfAttention(64).to(device).eval()
+    with torch.no_grad():
+        layer.gamma.fill_(1.0)
+    inputs = torch.randn(batch_size, 64, size, size, device=device)
+    layer.chunk_size = chunk_size
+
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+        before = torch.cuda.memory_allocated(device)
+    else:
+        before = peak_rss_bytes()
+    with torch.inference_mode():
+        output = layer(inputs)
+    if device.type == 'cuda':
+        peak = torch.cuda.max_memory_allocated(device) - before
+    else:
+        peak = peak_rss_bytes() - before
+
+    # Reference pass only after the peak has been taken
+    layer.chunk_size = None
+    with torch.inference_mode():
+        max_error = (output - layer(inputs)).abs().max().item()
+    layer.chunk_size = chunk_size
+
+    record = {'resolution': resolution, 'tokens': size * size, 'batch_size': batch_size,
+              'chunk_size': chunk_size, 'peak_bytes': peak, 'max_abs_error': max_error}
+    record.update(summarize(time_forward(layer, inputs, options['warmup'], options['iters']), batch_size))
+    return record
+
+
+def benchmark_attention(resolutions=(28, 56, 112), batch_sizes=(1, 16, 64), chunk_sizes=(None, 256, 64),
+                        warmup=3, iters=20, device='cpu'):
+    """Full vs tiled ``SelfAttention``; every configuration runs in a fresh process for a clean peak.
+
+    On CPU the peak is the growth of the RSS high-water mark during one
+    forward pass, so it only counts memory above what the process had
+    already touched.
+    """
+    options = {'warmup': warmup, 'iters': iters, 'device': device}
+    context = mp.get_context('spawn')
+    records = []
+    for resolution in resolutions:
+        for batch_size in batch_sizes:
+            for chunk_size in chunk_sizes:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    records.append(pool.submit(_attention_worker, resolution, batch_size, chunk_size,
+                                               options).result())
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _write_report(path, records):
+    if not path:
+        return
+    report = {
+        'commit': _git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'torch': torch.__version__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'records': records,
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def compare(records, baseline_records):
+    """Print the p50 ratio against a previous run for every configuration both runs share."""
+    key = lambda r: (r['model'], r['variant'], r['batch_size'], r['threads'])
+    baseline = {key(r): r for r in baseline_records}
+    for record in records:
+        old = baseline.get(key(record))
+        if old is not None:
+            print('{:<20} {:<14} bs={:<5} threads={:<3} p50 {:8.3f}ms -> {:8.3f}ms ({:+.1%})'.format(
+                record['model'], record['variant'], record['batch_size'], record['threads'],
+                old['p50_ms'], record['p50_ms'], record['p50_ms'] / old['p50_ms'] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--variants', nargs='+', default=['eager'], choices=list(VARIANTS))
+    parser.add_argument('--batch-sizes', nargs='+', type=int,
+                        help='default: {} (--attention: 1 16 64)'.format(' '.join(map(str, BATCH_SIZES))))
+    parser.add_argument('--threads', nargs='+', type=int, default=[torch.get_num_threads()])
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--iters', type=int, default=100)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file from an earlier run to compare against')
+    parser.add_argument('--attention', action='store_true', help='benchmark full vs tiled SelfAttention instead')
+    parser.add_argument('--resolutions', nargs='+', type=int, default=[28, 56, 112])
+    args = parser.parse_args()
+
+    if args.attention:
+        records = benchmark_attention(args.resolutions, args.batch_sizes or (1, 16, 64), warmup=args.warmup,
+                                      iters=args.iters, device=args.device)
+        for r in records:
+            print('{:>3}px bs={:<5} chunk={:<5} p50 {:9.3f}ms  peak {:8.1f} MiB  max err {:.2e}'.format(
+                r['resolution'], r['batch_size'], str(r['chunk_size']), r['p50_ms'],
+                r['peak_bytes'] / 2 ** 20, r['max_abs_error']))
+        _write_report(args.output, records)
+        return
+
+    records = run_suite(args.models, args.variants, args.batch_sizes or BATCH_SIZES, args.threads,
+                        args.warmup, args.iters, args.device)
+    for r in records:
+        print('{:<20} {:<14} bs={:<5} threads={:<3} p50 {:8.3f}ms p95 {:8.3f}ms p99 {:8.3f}ms '
+              '{:10.1f} img/s  peak RSS {:6.0f} MiB  max err {:.1e}'.format(
+                  r['model'], r['variant'], r['batch_size'], r['threads'], r['p50_ms'], r['p95_ms'],
+                  r['p99_ms'], r['images_per_sec'], r['peak_rss_bytes'] / 2 ** 20, r['max_abs_error']))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(records, json.load(f)['records'])
+
+    _write_report(args.output, records)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Confidence-based cascade over the three architectures.
+
+``Cascade`` runs the cheapest model on the whole batch, then gathers only
+the samples whose softmax confidence is below that stage's threshold,
+runs them through the next model and scatters the new probabilities back
+in place, until every sample is confident or the last model has run.
+
+``calibrate`` picks the thresholds offline: every model predicts the
+validation split once, then each threshold combination is simulated on the
+cached probabilities to get accuracy and the average cost per image (MACs
+from ``cost_model``, counting every stage an image went through).
+
+    python cascade.py --plot runs/cascade.png --target-accuracy 0.985 --output runs/cascade.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+
+import torch
+from torch import nn
+
+from cost_model import estimate_cost
+from models import load_model
+
+CHECKPOINTS = ['checkpoints/CNNFramework.pt', 'checkpoints/BranchingMergingCNN.pt', 'checkpoints/MAGE_CNN.pt']
+THRESHOLDS = [0.5, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999]
+
+
+class Cascade(nn.Module):
+    """``stages`` in increasing cost; ``thresholds[i]`` is the confidence stage ``i`` must reach to stop."""
+
+    def __init__(self, stages, thresholds):
+        super(Cascade, self).__init__()
+        if len(thresholds) != len(stages) - 1:
+            raise ValueError('need one threshold per stage except the last')
+        self.stages = nn.ModuleList(stages)
+        self.thresholds = list(thresholds)
+
+    def forward(self, x):
+        """Returns ``(probabilities, stage)``: final softmax per sample and the index of the model that produced it."""
+        probs = torch.softmax(self.stages[0](x).float(), dim=1)
+        stage = torch.zeros(x.size(0), dtype=torch.long, device=x.device)
+        active = torch.arange(x.size(0), device=x.device)
+        for i, threshold in enumerate(self.thresholds, 1):
+            # Rows of ``active`` hold the latest stage's probabilities
+            confidence = probs.index_select(0, active).max(1).values
+            active = active[confidence < threshold]
+            if active.numel() == 0:
+                break
+            sub_probs = torch.softmax(self.stages[i](x.index_select(0, active)).float(), dim=1)
+            probs.index_copy_(0, active, sub_probs)
+            stage.index_fill_(0, active, i)
+        return probs, stage
+
+
+def predict_all(model, loader, device):
+    """Softmax probabilities of ``model`` for every sample of ``loader``, in order."""
+    model.eval()
+    probs = []
+    with torch.inference_mode():
+        for inputs, _ in loader:
+            probs.append(torch.softmax(model(inputs.to(device)).float(), dim=1).cpu())
+    return torch.cat(probs)
+
+
+def simulate(probs, labels, costs, thresholds):
+    """Accuracy, average cost per image and per-stage fractions of a cascade, from cached ``probs``."""
+    confidence, preds = probs[0].max(1)
+    reached = torch.ones(len(labels), dtype=torch.bool)
+    cost = costs[0] * torch.ones(len(labels))
+    fractions = [1.0]
+    for i, threshold in enumerate(thresholds, 1):
+        reached = reached & (confidence < threshold)
+        stage_confidence, stage_preds = probs[i].max(1)
+        confidence = torch.where(reached, stage_confidence, confidence)
+        preds = torch.where(reached, stage_preds, preds)
+        cost += costs[i] * reached
+        fractions.append(reached.float().mean().item())
+    return {
+        'thresholds': list(thresholds),
+        'accuracy': (preds == labels).float().mean().item(),
+        'cost_per_image': cost.mean().item(),
+        'stage_fractions': fractions,
+    }
+
+
+def pareto_front(points):
+    """Points not beaten on both cost and accuracy, by increasing cost."""
+    front, best = [], -1.0
+    for point in sorted(points, key=lambda p: (p['cost_per_image'], -p['accuracy'])):
+        if point['accuracy'] > best:
+            front.append(point)
+            best = point['accuracy']
+    return front
+
+
+def calibrate(models, loader, grid=THRESHOLDS, device='cpu'):
+    """Simulate every threshold combination on ``loader``; returns ``(points, single-model points)``."""
+    labels = torch.cat([labels for _, labels in loader])
+    probs = [predict_all(model, loader, device) for model in models]
+    costs = [estimate_cost(model)['macs'] for model in models]
+    points = [simulate(probs, labels, costs, thresholds)
+              for thresholds in itertools.product(grid, repeat=len(models) - 1)]
+    singles = [{'model': type(model).__name__, 'cost_per_image': cost,
+                'accuracy': (p.argmax(1) == labels).float().mean().item()}
+               for model, p, cost in zip(models, probs, costs)]
+    return points, singles
+
+
+def choose(points, target_accuracy=None):
+    """Cheapest point reaching ``target_accuracy``, or the most accurate point without a target."""
+    if target_accuracy is None:
+        return max(points, key=lambda p: (p['accuracy'], -p['cost_per_image']))
+    feasible = [p for p in points if p['accuracy'] >= target_accuracy]
+    return min(feasible, key=lambda p: p['cost_per_image']) if feasible else None
+
+
+def plot_calibration(points, singles, chosen, path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    front = pareto_front(points)
+    plt.figure(figsize=(10, 7))
+    plt.scatter([p['cost_per_image'] / 1e6 for p in points], [p['accuracy'] for p in points],
+                s=12, alpha=0.4, label='threshold combinations')
+    plt.plot([p['cost_per_image'] / 1e6 for p in front], [p['accuracy'] for p in front],
+             marker='o', linewidth=2, label='Pareto front')
+    for single in singles:
+        plt.scatter(single['cost_per_image'] / 1e6, single['accuracy'], marker='s', s=60)
+        plt.annotate(single['model'], (single['cost_per_image'] / 1e6, single['accuracy']),
+                     textcoords='offset points', xytext=(5, -12))
+    if chosen is not None:
+        plt.scatter(chosen['cost_per_image'] / 1e6, chosen['accuracy'], marker='*', s=250, color='red',
+                    label='chosen {}'.format(chosen['thresholds']))
+    plt.xlabel('Average MMACs per image', fontsize=14)
+    plt.ylabel('Validation accuracy', fontsize=14)
+    plt.title('Cascade cost vs. accuracy', fontsize=16, fontweight='bold')
+    plt.grid(True, linestyle='--', alpha=0.6)
+    plt.legend(loc='lower right')
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    plt.savefig(path)
+
+
+def main():
+    from mnist_data import build_loaders
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--checkpoints', nargs='+', default=CHECKPOINTS, help='models in increasing cost')
+    parser.add_argument('--target-accuracy', type=float, help='pick the cheapest point reaching this val accuracy')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--plot', help='write the cost/accuracy plot to this image')
+    parser.add_argument('--output', help='write all points and the chosen thresholds to this JSON file')
+    args = parser.parse_args()
+
+    dataloaders, _, _ = build_loaders(mode='mmap', batch_size=1024)
+    models = [load_model(path, map_location=args.device) for path in args.checkpoints]
+    points, singles = calibrate(models, dataloaders['val'], device=args.device)
+    chosen = choose(points, args.target_accuracy)
+
+    for single in singles:
+        print('{:<20} acc {:.4f}  {:7.2f} MMACs/image'.format(
+            single['model'], single['accuracy'], single['cost_per_image'] / 1e6))
+    for point in pareto_front(points):
+        print('thresholds {}  acc {:.4f}  {:7.2f} MMACs/image  reached {}'.format(
+            point['thresholds'], point['accuracy'], point['cost_per_image'] / 1e6,
+            ' '.join('{:.1%}'.format(f) for f in point['stage_fractions'])))
+    print('chosen: {}'.format(chosen))
+
+    if args.plot:
+        plot_calibration(points, singles, chosen, args.plot)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'checkpoints': args.checkpoints, 'singles': singles, 'chosen': chosen, 'points': points},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Resumable training checkpoints written off the training thread.
+
+``CheckpointManager.save`` copies model, optimizer and scheduler state into
+preallocated CPU buffers (two sets, used alternately), then hands the
+snapshot to a background thread that writes it with ``torch.save`` to a
+temporary file and renames it into place. The directory keeps the latest
+checkpoint plus the best ``keep_best`` by val accuracy, tracked in
+``index.json``.
+"""
+
+import copy
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+INDEX = 'index.json'
+
+
+def copy_state(value, buffers=None):
+    """Copy a nested structure of tensors into ``buffers`` (allocated on first use) and return it.
+
+    Tensors are copied into CPU tensors of the same shape, pinned when the
+    source lives on the GPU, so repeated snapshots reuse the same memory.
+    """
+    if torch.is_tensor(value):
+        if buffers is None or buffers.shape != value.shape or buffers.dtype != value.dtype:
+            buffers = torch.empty(value.shape, dtype=value.dtype, pin_memory=value.is_cuda)
+        buffers.copy_(value.detach(), non_blocking=value.is_cuda)
+        return buffers
+    if isinstance(value, dict):
+        buffers = buffers if isinstance(buffers, dict) else {}
+        return type(value)((key, copy_state(item, buffers.get(key))) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        if not isinstance(buffers, (list, tuple)) or len(buffers) != len(value):
+            buffers = [None] * len(value)
+        return type(value)(copy_state(item, buffer) for item, buffer in zip(value, buffers))
+    return copy.deepcopy(value)
+
+
+def _atomic_write(path, write):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class CheckpointManager:
+    """Writes per-epoch training state in the background and keeps the latest + best-K files."""
+
+    def __init__(self, directory, keep_best=3):
+        self.directory = directory
+        self.keep_best = keep_best
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._buffers = [None, None]
+        self._pending = [None, None]
+        self._slot = 0
+        self.index = self._read_index()
+
+    def _read_index(self):
+        path = os.path.join(self.directory, INDEX)
+        if not os.path.exists(path):
+            return {'last': None, 'best': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def reset(self):
+        """Forget an earlier run in this directory: empty the index and delete its epoch files."""
+        self.wait()
+        with self._lock:
+            self.index = {'last': None, 'best': []}
+            for filename in os.listdir(self.directory):
+                if filename == INDEX or (filename.startswith('epoch_') and filename.endswith('.pt')):
+                    os.remove(os.path.join(self.directory, filename))
+
+    def save(self, epoch, model, optimizer=None, scheduler=None, history=None, val_acc=None, extra=None):
+        """Snapshot the training state for ``epoch``; returns once the copy is made, not the write."""
+        state = {
+            'epoch': epoch,
+            'model': model.state_dict(),
+            'optimizer': optimizer.state_dict() if optimizer is not None else None,
+            'scheduler': scheduler.state_dict() if scheduler is not None else None,
+            'history': history,
+            'val_acc': val_acc,
+            'rng_state': torch.get_rng_state(),
+            'extra': extra,
+        }
+        slot = self._slot
+        self._slot ^= 1
+        # The write that last used this buffer set has to finish before we overwrite it
+        if self._pending[slot] is not None:
+            self._pending[slot].result()
+        snapshot = self._buffers[slot] = copy_state(state, self._buffers[slot])
+
+        event = None
+        if torch.cuda.is_available() and any(p.is_cuda for p in model.parameters()):
+            event = torch.cuda.Event()
+            event.record()
+        self._pending[slot] = self._executor.submit(self._write, snapshot, epoch, val_acc, event)
+
+    def _write(self, snapshot, epoch, val_acc, event):
+        if event is not None:
+            event.synchronize()
+        name = 'epoch_{:04d}.pt'.format(epoch)
+        _atomic_write(os.path.join(self.directory, name), lambda tmp: torch.save(snapshot, tmp))
+
+        with self._lock:
+            index = self.index
+            index['last'] = name
+            best = [entry for entry in index['best'] if entry['file'] != name]
+            if val_acc is not None:
+                best.append({'file': name, 'epoch': epoch, 'val_acc': val_acc})
+            # Ties go to the earlier epoch, as in Trainer's best-model selection
+            best.sort(key=lambda entry: (-entry['val_acc'], entry['epoch']))
+            index['best'] = best[:self.keep_best]
+
+            def dump(tmp):
+                with open(tmp, 'w') as f:
+                    json.dump(index, f, indent=2)
+            _atomic_write(os.path.join(self.directory, INDEX), dump)
+
+            keep = {index['last']} | {entry['file'] for entry in index['best']}
+            for filename in os.listdir(self.directory):
+                if filename.startswith('epoch_') and filename.endswith('.pt') and filename not in keep:
+                    os.remove(os.path.join(self.directory, filename))
+
+    def wait(self):
+        """Block until every queued write is on disk (re-raising write errors)."""
+        for future in self._pending:
+            if future is not None:
+                future.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+    def _load(self, name, map_location):
+        if name is None:
+            return None
+        return torch.load(os.path.join(self.directory, name), map_location=map_location, weights_only=False)
+
+    def load_latest(self, map_location='cpu'):
+        """State saved for the most recent epoch, or None."""
+        return self._load(self.index['last'], map_location)
+
+    def load_best(self, map_location='cpu'):
+        """State of the epoch with the best val accuracy, or None."""
+        return self._load(self.index['best'][0]['file'] if self.index['best'] else None, map_location)
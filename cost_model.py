@@ -0,0 +1,110 @@
+"""Analytical compute and memory cost of the models in ``models.py``.
+
+``estimate_cost`` runs one forward pass of a copy of the model on the
+``meta`` device (shapes only, no data, no compute) with hooks on every
+layer, and derives per layer: multiply-accumulates, parameter and
+activation bytes, and arithmetic intensity (FLOPs per byte moved).
+``SelfAttention`` is charged for its two ``(H*W) x (H*W)`` bmms and the
+attention map on top of its 1x1 convolutions, which ``count_parameters``
+cannot see.
+
+    python cost_model.py --batch-size 64
+"""
+
+import argparse
+import copy
+
+import torch
+from torch import nn
+
+from models import SelfAttention
+
+
+def _conv_macs(module, output):
+    kh, kw = module.kernel_size
+    return output.numel() * (module.in_channels // module.groups) * kh * kw
+
+
+def _attention_cost(module, x, output, element_size):
+    # energy = query @ key: [B, N, C/8] x [B, C/8, N]; out = value @ attention^T: [B, C, N] x [B, N, N]
+    batch_size, channels, height, width = x.shape
+    n = height * width
+    qk_channels = module.query.out_channels
+    rows = min(module.chunk_size or n, n)
+    return {
+        'macs': batch_size * n * n * (qk_channels + channels),
+        'input_bytes': batch_size * n * (2 * qk_channels + channels) * element_size,
+        # energy and softmax of one tile (the full map when untiled), plus the output
+        'activation_bytes': 2 * batch_size * rows * n * element_size + output.numel() * element_size,
+    }
+
+
+def estimate_cost(model, input_size=28, batch_size=1, dtype=torch.float32):
+    """Per-layer and total MACs, activation bytes and arithmetic intensity for one forward pass.
+
+    Returns ``{'layers': [...], 'macs', 'parameter_bytes', 'activation_bytes',
+    'arithmetic_intensity'}``. Functional ops (``F.relu``, the residual
+    add) are not modules and are not counted.
+    """
+    element_size = torch.empty((), dtype=dtype).element_size()
+    meta_model = copy.deepcopy(model).to(device='meta', dtype=dtype).eval()
+    layers = []
+
+    def hook(name):
+        def record(module, inputs, output):
+            x = inputs[0]
+            weight_bytes = sum(p.numel() for p in module.parameters(recurse=False)) * element_size
+            cost = {'macs': 0, 'input_bytes': x.numel() * element_size,
+                    'activation_bytes': output.numel() * element_size}
+            if isinstance(module, nn.Conv2d):
+                cost['macs'] = _conv_macs(module, output)
+            elif isinstance(module, nn.Linear):
+                cost['macs'] = output.numel() * module.in_features
+            elif isinstance(module, SelfAttention):
+                cost = _attention_cost(module, x, output, element_size)
+            moved = cost['input_bytes'] + weight_bytes + cost['activation_bytes']
+            layers.append(dict(cost, layer=name, type=type(module).__name__, parameter_bytes=weight_bytes,
+                               arithmetic_intensity=2.0 * cost['macs'] / moved if moved else 0.0))
+        return record
+
+    handles = [module.register_forward_hook(hook(name)) for name, module in meta_model.named_modules()
+               if isinstance(module, SelfAttention) or not list(module.children())]
+    try:
+        with torch.no_grad():
+            meta_model(torch.empty(batch_size, 1, input_size, input_size, device='meta', dtype=dtype))
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    macs = sum(layer['macs'] for layer in layers)
+    moved = sum(layer['input_bytes'] + layer['parameter_bytes'] + layer['activation_bytes'] for layer in layers)
+    return {
+        'layers': layers,
+        'macs': macs,
+        'parameter_bytes': sum(layer['parameter_bytes'] for layer in layers),
+        'activation_bytes': sum(layer['activation_bytes'] for layer in layers),
+        'arithmetic_intensity': 2.0 * macs / moved if moved else 0.0,
+    }
+
+
+def main():
+    from models import MODELS
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--input-size', type=int, default=28)
+    args = parser.parse_args()
+
+    for name in args.models:
+        cost = estimate_cost(MODELS[name](), args.input_size, args.batch_size)
+        print('{}: {:.2f} MMACs, {:.1f} KiB activations, {:.1f} FLOP/byte'.format(
+            name, cost['macs'] / 1e6, cost['activation_bytes'] / 1024, cost['arithmetic_intensity']))
+        for layer in cost['layers']:
+            print('    {:<16} {:<14} {:10.3f} MMACs {:10.1f} KiB {:8.1f} FLOP/byte'.format(
+                layer['layer'], layer['type'], layer['macs'] / 1e6, layer['activation_bytes'] / 1024,
+                layer['arithmetic_intensity']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Data-parallel CPU training of one model across local processes (gloo).
+
+``train_ddp`` spawns ``world_size`` processes, each pinned to its own slice
+of the cores. Every rank trains a ``DistributedDataParallel`` replica on its
+``DistributedSampler`` shard of the training split and all-reduces
+gradients; val/test are split into disjoint strided shards whose loss and
+accuracy sums are all-reduced, so the metrics equal a single-process pass.
+Rank 0 reports them.
+
+    python ddp.py --model CNNFramework --world-sizes 1 2 4 8 --epochs 2 --output runs/ddp.json
+
+``--batch-size`` is per rank, so the global batch grows with the world size.
+"""
+
+import argparse
+import json
+import os
+import socket
+import tempfile
+import time
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn, optim
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DistributedSampler, Sampler
+
+from mnist_data import TensorLoader, open_cache, prepare_cache
+from models import MODELS, count_parameters
+from parallel_runner import DEFAULT_CONFIG, PRECISIONS, available_cores, partition_cores
+from training import Trainer
+
+
+class ShardSampler(Sampler):
+    """Positions ``rank, rank + world_size, ...`` of ``range(n)``: disjoint shards, no padding."""
+
+    def __init__(self, n, rank, world_size):
+        self.n = n
+        self.rank = rank
+        self.world_size = world_size
+
+    def __iter__(self):
+        return iter(range(self.rank, self.n, self.world_size))
+
+    def __len__(self):
+        return len(range(self.rank, self.n, self.world_size))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def sharded_loaders(rank, world_size, batch_size=64, seed=0):
+    """This rank's ``(dataloaders, testloader)`` over the shared memory-mapped cache."""
+    arrays = open_cache(prepare_cache())
+    train_labels = arrays['train_labels']
+    train = TensorLoader(arrays['train_images'], train_labels, batch_size,
+                         sampler=DistributedSampler(train_labels, world_size, rank, shuffle=True, seed=seed))
+
+    def shard(split):
+        labels = arrays[split + '_labels']
+        return TensorLoader(arrays[split + '_images'], labels, batch_size,
+                            sampler=ShardSampler(len(labels), rank, world_size))
+    return {'train': train, 'val': shard('val')}, shard('test')
+
+
+def _worker(rank, model_name, config, world_size, groups, port, result_path):
+    cores = groups[rank]
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    dist.init_process_group('gloo', init_method='tcp://127.0.0.1:{}'.format(port),
+                            rank=rank, world_size=world_size)
+    try:
+        torch.manual_seed(config['seed'])
+        model = MODELS[model_name]()
+        # Broadcasts rank 0's weights, so every replica starts identical
+        ddp_model = DistributedDataParallel(model)
+        # Different masks per rank, as a single process would draw across the shards
+        torch.manual_seed(config['seed'] + rank)
+
+        dataloaders, testloader = sharded_loaders(rank, world_size, config['batch_size'], config['seed'])
+        optimizer = optim.AdamW(ddp_model.parameters(), lr=config['lr'])
+        scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=config['step_size'], gamma=config['gamma'])
+        trainer = Trainer(ddp_model, nn.CrossEntropyLoss(), optimizer, scheduler,
+                          use_mask=config['use_mask'], mask_ratio=config['mask_ratio'], verbose=rank == 0,
+                          amp_dtype=PRECISIONS[config['precision']], distributed=True)
+
+        dist.barrier()
+        since = time.time()
+        history = trainer.fit(dataloaders, config['num_epochs'])
+        train_time = time.time() - since
+        test_acc = trainer.evaluate(testloader)
+
+        if rank == 0:
+            metrics = dict(history)
+            metrics['train_time'] = train_time
+            metrics['samples_per_sec'] = len(dataloaders['train'].sampler) * world_size * \
+                config['num_epochs'] / train_time
+            metrics['test_accuracy'] = test_acc
+            metrics['parameter_count'] = count_parameters(model)
+            metrics['world_size'] = world_size
+            metrics['threads_per_rank'] = len(cores)
+            with open(result_path, 'w') as f:
+                json.dump(metrics, f)
+    finally:
+        dist.destroy_process_group()
+
+
+def train_ddp(model_name, config=DEFAULT_CONFIG, world_size=2, cores=None):
+    """Train ``model_name`` on ``world_size`` local ranks; returns rank 0's ``metrics`` dict."""
+    cores = cores or available_cores()
+    groups = partition_cores(cores, [1] * world_size)
+    # Build the cache once, before the ranks map it
+    prepare_cache()
+    fd, result_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        mp.spawn(_worker, args=(model_name, config, world_size, groups, _free_port(), result_path),
+                 nprocs=world_size, join=True)
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def scaling_benchmark(model_name, world_sizes=(1, 2, 4, 8), config=DEFAULT_CONFIG):
+    """Throughput and accuracy of ``model_name`` per world size, relative to one process."""
+    results = {}
+    for world_size in world_sizes:
+        results[world_size] = train_ddp(model_name, config, world_size)
+    base = results[min(results)]
+    for metrics in results.values():
+        metrics['speedup'] = metrics['samples_per_sec'] / base['samples_per_sec']
+        metrics['test_accuracy_delta'] = metrics['test_accuracy'] - base['test_accuracy']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', default='CNNFramework', choices=list(MODELS))
+    parser.add_argument('--world-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--epochs', type=int, default=DEFAULT_CONFIG['num_epochs'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_CONFIG['batch_size'], help='per rank')
+    parser.add_argument('--precision', default='fp32', choices=list(PRECISIONS))
+    parser.add_argument('--output', help='write the collected metrics to this JSON file')
+    args = parser.parse_args()
+
+    config = dict(DEFAULT_CONFIG, num_epochs=args.epochs, batch_size=args.batch_size, precision=args.precision)
+    results = scaling_benchmark(args.model, args.world_sizes, config)
+    for world_size, metrics in results.items():
+        print('{:2d} ranks x {:2d} threads  {:8.1f} samples/s ({:4.2f}x)  test acc {:.4f} ({:+.4f})'.format(
+            world_size, metrics['threads_per_rank'], metrics['samples_per_sec'], metrics['speedup'],
+            metrics['test_accuracy'], metrics['test_accuracy_delta']))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'model': args.model, 'config': config, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
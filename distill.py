@@ -0,0 +1,123 @@
+"""Knowledge distillation from a trained ``MAGE_CNN`` into a ``CNNFramework`` student.
+
+The teacher runs once over the training split. Its logits are saved as a
+``.npy`` file next to the data cache, keyed by the teacher checkpoint's
+hash, and memory-mapped like the images. The student's ``TensorLoader``
+batches them alongside the labels, by the same (shuffled) dataset indices,
+so training never runs the teacher.
+
+    python distill.py checkpoints/MAGE_CNN.pt --width 0.5 --epochs 10 --output checkpoints/student.pt
+
+Reports test accuracy and per-image latency of the student, the teacher and
+(with ``--baseline``) the original ``CNNFramework``.
+"""
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch import nn, optim
+
+from benchmark import measure_inference_time
+from evaluation import evaluate
+from mnist_data import TensorLoader, _atomic_save, open_cache, prepare_cache
+from models import CNNFramework, count_parameters, load_model, save_model
+from training import Trainer
+
+
+class DistillationLoss(nn.Module):
+    """``alpha * T^2 * KL(student/T || teacher/T) + (1 - alpha) * CE``; plain CE without teacher logits."""
+
+    def __init__(self, temperature=4.0, alpha=0.9):
+        super(DistillationLoss, self).__init__()
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def forward(self, outputs, labels, teacher_logits=None):
+        hard = F.cross_entropy(outputs, labels)
+        if teacher_logits is None:
+            return hard
+        t = self.temperature
+        soft = F.kl_div(F.log_softmax(outputs / t, dim=1), F.log_softmax(teacher_logits.float() / t, dim=1),
+                        reduction='batchmean', log_target=True)
+        return self.alpha * t * t * soft + (1 - self.alpha) * hard
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def teacher_logits(teacher_path, images, cache_path, batch_size=1024, device='cpu'):
+    """Memory-mapped ``[N, 10]`` teacher logits for ``images``, computed on first use."""
+    path = os.path.join(cache_path, 'teacher_{}.npy'.format(_file_digest(teacher_path)))
+    if not os.path.exists(path):
+        teacher = load_model(teacher_path, map_location=device)
+        logits = torch.empty(len(images), 10)
+        with torch.inference_mode():
+            for start in range(0, len(images), batch_size):
+                batch = images[start:start + batch_size].to(device)
+                logits[start:start + batch_size] = teacher(batch).float().cpu()
+        _atomic_save(path, logits.numpy())
+    return torch.from_numpy(np.load(path, mmap_mode='c'))
+
+
+def distill(teacher_path, width=1.0, num_epochs=10, temperature=4.0, alpha=0.9, lr=0.001, batch_size=64,
+            device='cpu'):
+    """Train a ``CNNFramework(width)`` student on cached teacher logits; returns ``(student, history, testloader)``."""
+    device = torch.device(device)
+    cache_path = prepare_cache()
+    arrays = open_cache(cache_path)
+    logits = teacher_logits(teacher_path, arrays['train_images'], cache_path, device=device)
+
+    dataloaders = {
+        'train': TensorLoader(arrays['train_images'], arrays['train_labels'], batch_size, shuffle=True,
+                              extras=(logits,)),
+        'val': TensorLoader(arrays['val_images'], arrays['val_labels'], batch_size),
+    }
+    testloader = TensorLoader(arrays['test_images'], arrays['test_labels'], batch_size)
+
+    student = CNNFramework(width).to(device)
+    optimizer = optim.AdamW(student.parameters(), lr=lr)
+    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.1)
+    trainer = Trainer(student, DistillationLoss(temperature, alpha), optimizer, scheduler, device=device)
+    history = trainer.fit(dataloaders, num_epochs)
+    return student, history, testloader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('teacher', help='MAGE_CNN checkpoint written by save_model')
+    parser.add_argument('--baseline', help='CNNFramework checkpoint to compare against')
+    parser.add_argument('--width', type=float, default=1.0, help='student channel multiplier')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.9, help='weight of the distillation term')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--output', help='save the student here')
+    args = parser.parse_args()
+
+    student, _, testloader = distill(args.teacher, args.width, args.epochs, args.temperature, args.alpha,
+                                     device=args.device)
+    if args.output:
+        save_model(student, args.output)
+
+    models = [('student (width {:g})'.format(args.width), student.eval()),
+              ('teacher', load_model(args.teacher, map_location=args.device))]
+    if args.baseline:
+        models.append(('baseline', load_model(args.baseline, map_location=args.device)))
+    for name, model in models:
+        accuracy = evaluate(model, testloader, torch.device(args.device))['accuracy']
+        latency = measure_inference_time(model, testloader, args.device)
+        print('{:<20} test acc {:.4f}  {:8.1f} us/image  {:9,d} params'.format(
+            name, accuracy, latency * 1e6, count_parameters(model)))
+
+
+if __name__ == '__main__':
+    main()
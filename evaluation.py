@@ -0,0 +1,125 @@
+"""Single-pass evaluation: every metric from one ``inference_mode`` pass over a loader.
+
+Per batch, ``evaluate`` only adds to on-device counters: a bincounted
+confusion matrix, top-k hit counts, cross-entropy sum and per-confidence-bin
+sums for calibration. The counters are copied to the host once, at the end,
+and turned into accuracy, top-k accuracy, per-class precision/recall and the
+expected calibration error (ECE).
+
+    python evaluation.py checkpoints/MAGE_CNN.pt --split test --batch-size 4096
+"""
+
+import argparse
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+
+from mnist_data import TensorLoader
+
+
+def rebatch(data, batch_size):
+    """An unshuffled loader over ``data`` (a loader or a ``Dataset``) with ``batch_size``."""
+    if isinstance(data, TensorLoader):
+        return TensorLoader(data.images, data.labels, batch_size, mean=data.mean, std=data.std,
+                            sampler=data.sampler)
+    if isinstance(data, DataLoader):
+        return DataLoader(data.dataset, batch_size=batch_size, num_workers=data.num_workers)
+    if isinstance(data, Dataset):
+        return DataLoader(data, batch_size=batch_size)
+    return data
+
+
+def evaluate(model, data, device=None, batch_size=1024, num_classes=10, topk=(1, 3, 5), num_bins=15,
+             amp_dtype=None, memory_format=torch.contiguous_format):
+    """Accuracy, top-k accuracy, loss, confusion matrix, per-class precision/recall and ECE of ``model``.
+
+    ``data`` is a loader (re-batched to ``batch_size`` unless None) or any
+    ``Dataset`` of ``(image, label)`` pairs. ``confusion_matrix[i, j]``
+    counts samples of class ``i`` predicted as ``j``.
+    """
+    device = device if device is not None else next(model.parameters()).device
+    max_k = max(topk)
+    confusion = torch.zeros(num_classes * num_classes, dtype=torch.long, device=device)
+    topk_hits = torch.zeros(max_k, dtype=torch.long, device=device)
+    loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+    bin_count = torch.zeros(num_bins, dtype=torch.float64, device=device)
+    bin_confidence = torch.zeros(num_bins, dtype=torch.float64, device=device)
+    bin_correct = torch.zeros(num_bins, dtype=torch.float64, device=device)
+
+    was_training = model.training
+    model.eval()
+    with torch.inference_mode():
+        for inputs, labels in rebatch(data, batch_size) if batch_size else data:
+            inputs = inputs.to(device, non_blocking=True, memory_format=memory_format)
+            labels = labels.to(device, non_blocking=True)
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                logits = model(inputs)
+            logits = logits.float()
+
+            loss_sum += F.cross_entropy(logits, labels, reduction='sum')
+            ranked = logits.topk(max_k, dim=1).indices
+            # Hit at rank r counts towards every k > r
+            topk_hits += (ranked == labels.unsqueeze(1)).sum(0)
+            preds = ranked[:, 0]
+            confusion += torch.bincount(labels * num_classes + preds, minlength=num_classes * num_classes)
+
+            confidences = torch.softmax(logits, dim=1).gather(1, preds.unsqueeze(1)).squeeze(1)
+            bins = (confidences * num_bins).long().clamp_(max=num_bins - 1)
+            bin_count += torch.bincount(bins, minlength=num_bins)
+            bin_confidence += torch.bincount(bins, weights=confidences.double(), minlength=num_bins)
+            bin_correct += torch.bincount(bins, weights=(preds == labels).double(), minlength=num_bins)
+    model.train(was_training)
+
+    confusion = confusion.view(num_classes, num_classes).cpu()
+    topk_hits, bin_count = topk_hits.cumsum(0).cpu(), bin_count.cpu()
+    bin_confidence, bin_correct = bin_confidence.cpu(), bin_correct.cpu()
+    total = int(confusion.sum())
+    true_positives = confusion.diag().double()
+    filled = bin_count > 0
+    ece = ((bin_correct[filled] - bin_confidence[filled]).abs().sum() / max(total, 1)).item()
+    return {
+        'num_samples': total,
+        'accuracy': true_positives.sum().item() / max(total, 1),
+        'top_k': {k: topk_hits[k - 1].item() / max(total, 1) for k in topk},
+        'loss': loss_sum.item() / max(total, 1),
+        'confusion_matrix': confusion,
+        # Classes never predicted (or absent) get 0 instead of NaN
+        'precision': (true_positives / confusion.sum(0).clamp(min=1)).tolist(),
+        'recall': (true_positives / confusion.sum(1).clamp(min=1)).tolist(),
+        'ece': ece,
+    }
+
+
+def format_report(report):
+    lines = ['{} samples  acc {:.4f}  {}  loss {:.4f}  ECE {:.4f}'.format(
+        report['num_samples'], report['accuracy'],
+        '  '.join('top-{} {:.4f}'.format(k, acc) for k, acc in report['top_k'].items()),
+        report['loss'], report['ece'])]
+    lines.append('class  precision  recall')
+    for label, (precision, recall) in enumerate(zip(report['precision'], report['recall'])):
+        lines.append('{:5d}  {:9.4f}  {:6.4f}'.format(label, precision, recall))
+    lines.append('confusion matrix (rows: true, columns: predicted)')
+    lines += [' '.join('{:5d}'.format(count) for count in row) for row in report['confusion_matrix'].tolist()]
+    return '\n'.join(lines)
+
+
+def main():
+    from mnist_data import build_loaders
+    from models import load_model
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('checkpoint')
+    parser.add_argument('--split', choices=['val', 'test'], default='test')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    dataloaders, _, testloader = build_loaders(mode='mmap')
+    loader = dataloaders['val'] if args.split == 'val' else testloader
+    model = load_model(args.checkpoint, map_location=args.device)
+    print(format_report(evaluate(model, loader, torch.device(args.device), args.batch_size)))
+
+
+if __name__ == '__main__':
+    main()
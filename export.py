@@ -0,0 +1,106 @@
+"""Compiled inference paths for the trained models.
+
+``export_torchscript`` traces a model, freezes its weights into the graph and
+runs ``torch.jit.optimize_for_inference`` (conv+ReLU fusion, oneDNN layouts on
+CPU). The saved artifact loads with ``torch.jit.load`` alone, without
+``models.py``. ``compile_model`` is the ``torch.compile`` (inductor) path; it
+lives only in the current process and is meant for in-process serving.
+
+    python export.py checkpoints/MAGE_CNN.pt --output exported/MAGE_CNN.ts --check
+"""
+
+import argparse
+import os
+
+import torch
+
+from models import load_model
+
+
+def trace_for_inference(model, example_inputs=None):
+    """Traced, frozen and inference-optimized TorchScript version of ``model``.
+
+    This is ``torch.jit.trace``, not ``torch.jit.script``: data-dependent
+    control flow is frozen to the path ``example_inputs`` take. For
+    ``MAGE_CNN`` that is the ``mask is None`` branch of ``forward``, and each
+    ``SelfAttention`` keeps whichever of its chunked or full-attention paths
+    the example batch selected.
+    """
+    model = model.eval()
+    if example_inputs is None:
+        device = next(model.parameters()).device
+        example_inputs = torch.randn(64, 1, 28, 28, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_inputs)
+        traced = torch.jit.freeze(traced)
+        traced = torch.jit.optimize_for_inference(traced)
+    return traced
+
+
+def export_torchscript(model, path, example_inputs=None):
+    """Save ``trace_for_inference(model)`` to ``path`` and return it."""
+    traced = trace_for_inference(model, example_inputs)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    torch.jit.save(traced, path)
+    return traced
+
+
+def compile_model(model, mode=None):
+    """``torch.compile`` with the inductor backend and weight freezing.
+
+    Freezing is passed as a per-compile option, so other ``torch.compile``
+    calls in the process keep the global inductor config.
+    """
+    from torch._inductor import list_mode_options
+
+    # torch.compile takes either mode or options, so the mode's options are merged in here
+    options = dict(list_mode_options(mode) if mode else {}, freezing=True)
+    return torch.compile(model.eval(), backend='inductor', options=options)
+
+
+def check_against_eager(model, candidate, loader, device='cpu'):
+    """Run both models over ``loader``; returns max abs logit error, prediction agreement and accuracies."""
+    model = model.eval()
+    max_error = 0.0
+    agree = correct_eager = correct_candidate = total = 0
+    with torch.inference_mode():
+        for inputs, labels in loader:
+            inputs, labels = inputs.to(device), labels.to(device)
+            expected = model(inputs)
+            actual = candidate(inputs).float()
+            max_error = max(max_error, (expected - actual).abs().max().item())
+            agree += (expected.argmax(1) == actual.argmax(1)).sum().item()
+            correct_eager += (expected.argmax(1) == labels).sum().item()
+            correct_candidate += (actual.argmax(1) == labels).sum().item()
+            total += labels.size(0)
+    return {
+        'max_abs_error': max_error,
+        'agreement': agree / total,
+        'eager_accuracy': correct_eager / total,
+        'candidate_accuracy': correct_candidate / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a checkpoint saved by models.save_model as TorchScript.')
+    parser.add_argument('checkpoint')
+    parser.add_argument('--output', help='default: exported/<checkpoint name>.ts')
+    parser.add_argument('--check', action='store_true', help='compare against eager outputs on the test set')
+    args = parser.parse_args()
+
+    model = load_model(args.checkpoint)
+    output = args.output or os.path.join('exported', os.path.splitext(os.path.basename(args.checkpoint))[0] + '.ts')
+    export_torchscript(model, output)
+    print('saved {}'.format(output))
+
+    if args.check:
+        from mnist_data import build_loaders
+
+        _, _, testloader = build_loaders(mode='mmap', batch_size=256)
+        report = check_against_eager(model, torch.jit.load(output), testloader)
+        print('max abs error {max_abs_error:.2e}  agreement {agreement:.4%}  '
+              'accuracy eager {eager_accuracy:.4f} / exported {candidate_accuracy:.4f}'.format(**report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Bounded-memory sample selection over an evaluation loader.
+
+``collect_samples`` makes one pass over an unshuffled loader. Per batch it
+computes predictions and confidences as tensors, feeds the positions of
+correct and misclassified samples to two reservoirs of size k, and keeps a
+running top-N of the most confident errors. Memory is O(k + N). Images are
+gathered only for the chosen positions, at the end.
+
+    python inspection.py checkpoints/MAGE_CNN.pt --split test --top-errors 100 --output errors.json
+"""
+
+import argparse
+import json
+
+import torch
+
+
+class Reservoir:
+    """Uniform sample of at most ``k`` stream positions (Algorithm R), fed a batch at a time."""
+
+    def __init__(self, k, generator=None):
+        self.k = k
+        self.seen = 0
+        self.items = torch.empty(k, dtype=torch.long)
+        self.generator = generator
+
+    def add(self, positions):
+        n = positions.numel()
+        fill = min(max(self.k - self.seen, 0), n)
+        if fill:
+            self.items[self.seen:self.seen + fill] = positions[:fill]
+        rest = positions[fill:]
+        if rest.numel():
+            # The item at stream index t replaces slot j ~ U{0..t} if j < k
+            t = torch.arange(self.seen + fill, self.seen + n, dtype=torch.float64)
+            slots = (torch.rand(rest.numel(), dtype=torch.float64, generator=self.generator) * (t + 1)).long()
+            accepted = slots < self.k
+            # Few items pass once the reservoir is full; apply them in stream order
+            for slot, position in zip(slots[accepted].tolist(), rest[accepted].tolist()):
+                self.items[slot] = position
+        self.seen += n
+
+    def sample(self):
+        return self.items[:min(self.k, self.seen)].clone()
+
+
+def gather(loader, positions):
+    """Images and labels at ``positions`` of an unshuffled ``loader``'s dataset."""
+    if hasattr(loader, 'gather'):
+        return loader.gather(positions)
+    items = [loader.dataset[i] for i in positions.tolist()]
+    if not items:
+        return torch.empty(0, 1, 28, 28), torch.empty(0, dtype=torch.long)
+    return torch.stack([image for image, _ in items]), torch.as_tensor([label for _, label in items])
+
+
+def _describe(model, loader, positions, device):
+    images, labels = gather(loader, positions)
+    if len(positions) == 0:
+        return []
+    with torch.no_grad():
+        confidences, preds = torch.softmax(model(images.to(device)), dim=1).max(1)
+    return [{'image': image, 'pred': pred, 'true_label': label, 'confidence': confidence, 'index': index}
+            for image, pred, label, confidence, index in zip(
+                images, preds.tolist(), labels.tolist(), confidences.tolist(), positions.tolist())]
+
+
+def collect_samples(model, loader, num_correct=8, num_wrong=8, top_errors=0, device='cpu', seed=None):
+    """Random correct/misclassified samples plus the ``top_errors`` most confident mistakes.
+
+    Returns ``{'correct': [...], 'wrong': [...], 'top_errors': [...]}``; every
+    sample is a dict with ``image``, ``pred``, ``true_label``, ``confidence``
+    and ``index`` (its position in the loader's dataset).
+    """
+    generator = torch.Generator().manual_seed(seed) if seed is not None else None
+    correct = Reservoir(num_correct, generator)
+    wrong = Reservoir(num_wrong, generator)
+    top_conf = torch.empty(0, device=device)
+    top_pos = torch.empty(0, dtype=torch.long, device=device)
+
+    model.eval()
+    offset = 0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            inputs, labels = inputs.to(device), labels.to(device)
+            confidences, preds = torch.softmax(model(inputs), dim=1).max(1)
+            is_correct = preds == labels
+            positions = torch.arange(offset, offset + labels.size(0))
+            offset += labels.size(0)
+
+            is_correct_cpu = is_correct.cpu()
+            correct.add(positions[is_correct_cpu])
+            wrong.add(positions[~is_correct_cpu])
+
+            if top_errors:
+                top_conf = torch.cat([top_conf, confidences[~is_correct]])
+                top_pos = torch.cat([top_pos, positions.to(device)[~is_correct]])
+                if top_conf.numel() > top_errors:
+                    top_conf, order = top_conf.topk(top_errors)
+                    top_pos = top_pos[order]
+
+    order = top_conf.argsort(descending=True)
+    return {
+        'correct': _describe(model, loader, correct.sample(), device),
+        'wrong': _describe(model, loader, wrong.sample(), device),
+        'top_errors': _describe(model, loader, top_pos[order].cpu(), device),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dump the most confident errors of a trained model.')
+    parser.add_argument('checkpoint')
+    parser.add_argument('--split', choices=['val', 'test'], default='val')
+    parser.add_argument('--top-errors', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--output', help='write the errors (without images) to this JSON file')
+    args = parser.parse_args()
+
+    from mnist_data import build_loaders
+    from models import load_model
+
+    dataloaders, _, testloader = build_loaders(mode='mmap', batch_size=args.batch_size)
+    loader = dataloaders['val'] if args.split == 'val' else testloader
+    samples = collect_samples(load_model(args.checkpoint), loader, 0, 0, args.top_errors)
+
+    errors = [{key: value for key, value in sample.items() if key != 'image'} for sample in samples['top_errors']]
+    for error in errors:
+        print('#{index:<6} predicted {pred} (true {true_label})  conf {confidence:.4f}'.format(**error))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(errors, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Load generator for ``serve.py``.
+
+Opens ``--concurrency`` keep-alive connections, each posting MNIST test digits
+one at a time, and reports throughput and p50/p95/p99 latency.
+
+    python loadgen.py --port 8000 --concurrency 64 --requests 200
+    python loadgen.py --compare checkpoints/MAGE_CNN.pt --concurrency 64
+
+``--compare`` starts the server itself, once with ``--max-batch-size 1``
+(no batching) and once with dynamic batching, and loads both the same way.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from benchmark import percentile
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+
+
+def _request(path, body=b''):
+    method = 'POST' if body else 'GET'
+    head = '{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'.format(method, path, len(body))
+    return head.encode() + body
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = 0
+    for line in head.decode('latin-1').split('\r\n'):
+        if line.lower().startswith('content-length:'):
+            length = int(line.split(':', 1)[1])
+    return head.split(b' ', 2)[1], await reader.readexactly(length)
+
+
+async def _connect(host, port, unix_path):
+    if unix_path:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+
+async def _client(images, offset, num_requests, latencies, host, port, unix_path):
+    reader, writer = await _connect(host, port, unix_path)
+    try:
+        for i in range(num_requests):
+            body = images[(offset + i) % len(images)]
+            start = time.perf_counter_ns()
+            writer.write(_request('/predict', body))
+            await writer.drain()
+            status, _ = await _read_response(reader)
+            if status != b'200':
+                raise RuntimeError('server answered {}'.format(status.decode()))
+            latencies.append(time.perf_counter_ns() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(images, concurrency=64, requests_per_client=200, host='127.0.0.1', port=8000, unix_path=None):
+    """Drive the server with ``concurrency`` clients; returns throughput and latency percentiles."""
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(images, i * requests_per_client, requests_per_client, latencies, host, port, unix_path)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) / 1e6,
+        'p95_ms': percentile(latencies, 95) / 1e6,
+        'p99_ms': percentile(latencies, 99) / 1e6,
+    }
+
+
+async def _wait_until_up(host, port, unix_path, timeout=60.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            reader, writer = await _connect(host, port, unix_path)
+            writer.write(_request('/health'))
+            await writer.drain()
+            await _read_response(reader)
+            writer.close()
+            return
+        except (OSError, asyncio.IncompleteReadError):
+            if time.time() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def test_images():
+    from mnist_data import load_mnist
+
+    images, _ = load_mnist(train=False)
+    return [image.numpy().tobytes() for image in images]
+
+
+def _print(name, result):
+    print('{:<16} {:9.1f} req/s  p50 {:7.2f}ms  p95 {:7.2f}ms  p99 {:7.2f}ms'.format(
+        name, result['throughput_rps'], result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for serve.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', help='connect to this Unix socket instead of TCP')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=200, help='requests per client')
+    parser.add_argument('--compare', metavar='MODEL', help='start serve.py with and without batching for MODEL')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    images = test_images()
+    if not args.compare:
+        _print('server', asyncio.run(run_load(images, args.concurrency, args.requests,
+                                               args.host, args.port, args.unix)))
+        return
+
+    for name, batch_size in [('no batching', 1), ('dynamic batching', args.max_batch_size)]:
+        command = [sys.executable, SERVER, args.compare, '--host', args.host, '--port', str(args.port),
+                   '--max-batch-size', str(batch_size), '--max-wait-ms', str(args.max_wait_ms)]
+        if args.unix:
+            command += ['--unix', args.unix]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        try:
+            asyncio.run(_wait_until_up(args.host, args.port, args.unix))
+            _print(name, asyncio.run(run_load(images, args.concurrency, args.requests,
+                                              args.host, args.port, args.unix)))
+        finally:
+            server.terminate()
+            server.wait()
+            if args.unix and os.path.exists(args.unix):
+                os.remove(args.unix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Persistent, append-only store for training metrics.
+
+``MetricsStore.log`` only puts a row on a queue; a background thread drains
+the queue in batches into SQLite, so the training loop never waits on disk.
+Values may be 0-d tensors: they are converted with ``float()`` on the writer
+thread, which keeps even per-step losses off the hot loop's critical path.
+Rows are keyed by run id and model name, and every run stays in the file.
+
+``MetricsLogger`` is the ``Trainer`` callback that feeds it; ``series``
+reads a metric back for the charts in ``code.py``.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import torch
+
+from training import Callback
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, model TEXT, started REAL, config TEXT);
+CREATE TABLE IF NOT EXISTS metrics (run_id TEXT, model TEXT, epoch INTEGER, step INTEGER,
+                                    name TEXT, value REAL, time REAL);
+CREATE INDEX IF NOT EXISTS metrics_by_run ON metrics (run_id, name);
+'''
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+def new_run_id():
+    return '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:6])
+
+
+class MetricsStore:
+    """SQLite metrics file written by one background thread."""
+
+    def __init__(self, path='runs/metrics.db'):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with sqlite3.connect(path) as connection:
+            connection.executescript(SCHEMA)
+        self._queue = queue.SimpleQueue()
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        connection = sqlite3.connect(self.path)
+        closing = False
+        while not closing:
+            # Block for the first item, then take whatever else is already queued
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            runs, rows, flushes = [], [], []
+            for item in items:
+                if item is _CLOSE:
+                    closing = True
+                elif isinstance(item, threading.Event):
+                    flushes.append(item)
+                elif item[0] == 'run':
+                    runs.append(item[1:])
+                else:
+                    run_id, model, epoch, step, name, value, t = item[1:]
+                    # A value that isn't a number is dropped and reported on the next flush
+                    try:
+                        rows.append((run_id, model, epoch, step, name, float(value), t))
+                    except (TypeError, ValueError, RuntimeError) as e:
+                        self._error = ValueError('cannot log {}={!r}: {}'.format(name, value, e))
+            try:
+                with connection:
+                    connection.executemany('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)', runs)
+                    connection.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            except Exception as e:
+                self._error = e
+            finally:
+                # Waiting callers are always released, with the error if there was one
+                for event in flushes:
+                    event.set()
+        connection.close()
+
+    def start_run(self, model, config=None, run_id=None):
+        """Register a run of ``model`` and return its id."""
+        run_id = run_id or new_run_id()
+        self._queue.put(('run', run_id, model, time.time(), json.dumps(config or {}, default=str)))
+        return run_id
+
+    def log(self, run_id, model, name, value, epoch=None, step=None):
+        """Queue one value (a number or a 0-d tensor); returns immediately."""
+        if torch.is_tensor(value):
+            value = value.detach()
+        self._queue.put(('metric', run_id, model, epoch, step, name, value, time.time()))
+
+    def flush(self):
+        """Block until everything logged so far is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def latest_run(self, model):
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute('SELECT run_id FROM runs WHERE model = ? ORDER BY started DESC LIMIT 1',
+                                     (model,)).fetchone()
+        return row[0] if row else None
+
+    def series(self, model, name, run_id=None):
+        """Per-epoch values of ``name`` for ``run_id`` (default: the latest run of ``model``).
+
+        An epoch logged more than once (retrained after a resume) keeps its latest value.
+        """
+        run_id = run_id or self.latest_run(model)
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute('SELECT epoch, value FROM metrics WHERE run_id = ? AND name = ? '
+                                      'AND step IS NULL AND epoch IS NOT NULL ORDER BY epoch, time',
+                                      (run_id, name)).fetchall()
+        return list(dict(rows).values())
+
+    def summary(self, model, run_id=None):
+        """Run-level values (logged without epoch or step) of the latest run of ``model``."""
+        run_id = run_id or self.latest_run(model)
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute('SELECT name, value FROM metrics WHERE run_id = ? AND epoch IS NULL '
+                                      'AND step IS NULL ORDER BY time', (run_id,)).fetchall()
+        return dict(rows)
+
+
+class MetricsLogger(Callback):
+    """Sends every epoch's logs (and, with ``log_every``, every n-th training loss) to a ``MetricsStore``.
+
+    With ``resume=True`` the latest run of ``model`` is continued, so a run
+    resumed from a checkpoint keeps its earlier epochs in one series.
+    """
+
+    def __init__(self, store, model, config=None, log_every=None, run_id=None, resume=False):
+        self.store = store
+        self.model = model
+        self.log_every = log_every
+        if run_id is None and resume:
+            run_id = store.latest_run(model)
+        self.run_id = store.start_run(model, config, run_id)
+
+    def on_batch_end(self, trainer, step, logs):
+        if self.log_every and step % self.log_every == 0:
+            for name, value in logs.items():
+                self.store.log(self.run_id, self.model, name, value, step=step)
+
+    def on_epoch_end(self, trainer, epoch, logs):
+        for name, value in logs.items():
+            self.store.log(self.run_id, self.model, name, value, epoch=epoch)
+
+    def log_summary(self, metrics):
+        """Log the scalar entries of a ``metrics`` dict (test accuracy, parameter count, ...)."""
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.store.log(self.run_id, self.model, name, value)
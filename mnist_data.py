@@ -0,0 +1,253 @@
+"""MNIST loading for the notebook sections.
+
+Besides the original torchvision pipeline (``ToTensor()`` + ``Normalize`` run
+per sample, default collation), every split can be decoded once into
+contiguous tensors and served by ``TensorLoader``, which slices whole batches
+out of memory instead of building them sample by sample.
+
+``prepare_cache`` goes one step further and writes the normalized splits and
+the fixed train/val indices to ``.npy`` files under ``data/cache/<key>/``.
+They are memory-mapped on open, so every section and every process that uses
+them shares the same page-cache pages.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset, TensorDataset
+from torchvision import datasets, transforms
+from sklearn.model_selection import train_test_split
+
+MEAN = 0.5
+STD = 0.5
+
+
+def normalize(images, mean=MEAN, std=STD):
+    """Same arithmetic as ``ToTensor()`` + ``Normalize((mean,), (std,))``, for a whole uint8 batch."""
+    if images.dim() == 3:
+        images = images.unsqueeze(1)
+    return images.float().div_(255).sub_(mean).div_(std)
+
+
+class TensorLoader:
+    """Drop-in replacement for ``DataLoader`` over in-memory image/label tensors.
+
+    Unshuffled batches are views into ``images``; shuffled batches cost one
+    ``index_select`` each. uint8 images are normalized per batch. A
+    ``sampler`` (e.g. ``DistributedSampler``) picks the order instead of
+    ``shuffle``, as in ``DataLoader``. ``extras`` are further per-sample
+    tensors (e.g. cached teacher logits) batched alongside the labels.
+    """
+
+    def __init__(self, images, labels, batch_size=64, shuffle=False, drop_last=False,
+                 mean=MEAN, std=STD, generator=None, sampler=None, extras=()):
+        if sampler is not None and shuffle:
+            raise ValueError('sampler option is mutually exclusive with shuffle')
+        self.images = images
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.mean = mean
+        self.std = std
+        self.generator = generator
+        self.sampler = sampler
+        self.extras = tuple(extras)
+        self.dataset = TensorDataset(images, labels)
+
+    def __len__(self):
+        n = len(self.sampler) if self.sampler is not None else len(self.labels)
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
+
+    def _prepare(self, images):
+        if images.dtype == torch.uint8:
+            return normalize(images, self.mean, self.std)
+        return images
+
+    def __iter__(self):
+        if self.sampler is not None:
+            order = torch.as_tensor(list(self.sampler), dtype=torch.long)
+        elif self.shuffle:
+            order = torch.randperm(len(self.labels), generator=self.generator)
+        else:
+            order = None
+        n = len(order) if order is not None else len(self.labels)
+        for start in range(0, len(self) * self.batch_size, self.batch_size):
+            end = min(start + self.batch_size, n)
+            if order is None:
+                images, labels = self.images[start:end], self.labels[start:end]
+                extras = tuple(extra[start:end] for extra in self.extras)
+            else:
+                idx = order[start:end]
+                images, labels = self.images.index_select(0, idx), self.labels.index_select(0, idx)
+                extras = tuple(extra.index_select(0, idx) for extra in self.extras)
+            yield (self._prepare(images), labels) + extras
+
+    def gather(self, positions):
+        """Prepared images and labels at ``positions``, in one ``index_select`` each."""
+        return self._prepare(self.images.index_select(0, positions)), self.labels.index_select(0, positions)
+
+
+def load_mnist(root='data/', train=True):
+    """Decode one MNIST split into uint8 images ``[N, 1, 28, 28]`` and int64 labels."""
+    dataset = datasets.MNIST(root, download=True, train=train)
+    return dataset.data.unsqueeze(1).contiguous(), dataset.targets.clone()
+
+
+def split_indices(n, test_size=0.2, random_state=42):
+    """The fixed train/val split used by every section of ``code.py``."""
+    train_indices, val_indices = train_test_split(range(n), test_size=test_size, random_state=random_state)
+    return torch.as_tensor(train_indices), torch.as_tensor(val_indices)
+
+
+def _torchvision_loaders(root, batch_size, test_size, random_state):
+    transform = transforms.Compose([
+        transforms.ToTensor(),
+        transforms.Normalize((MEAN,), (STD,)),
+    ])
+    full_trainset = datasets.MNIST(root, download=True, train=True, transform=transform)
+    train_indices, val_indices = split_indices(len(full_trainset), test_size, random_state)
+    trainset = Subset(full_trainset, train_indices.tolist())
+    valset = Subset(full_trainset, val_indices.tolist())
+    testset = datasets.MNIST(root, download=True, train=False, transform=transform)
+    return (DataLoader(trainset, batch_size=batch_size, shuffle=True),
+            DataLoader(valset, batch_size=batch_size, shuffle=False),
+            DataLoader(testset, batch_size=batch_size, shuffle=False))
+
+
+def _tensor_loaders(root, batch_size, test_size, random_state, pre_normalize):
+    images, labels = load_mnist(root, train=True)
+    test_images, test_labels = load_mnist(root, train=False)
+    train_indices, val_indices = split_indices(len(labels), test_size, random_state)
+
+    prepare = normalize if pre_normalize else (lambda x: x)
+    train_images = prepare(images.index_select(0, train_indices))
+    val_images = prepare(images.index_select(0, val_indices))
+    test_images = prepare(test_images)
+
+    return (TensorLoader(train_images, labels.index_select(0, train_indices), batch_size, shuffle=True),
+            TensorLoader(val_images, labels.index_select(0, val_indices), batch_size),
+            TensorLoader(test_images, test_labels, batch_size))
+
+
+CACHE_FILES = ('train_images', 'train_labels', 'val_images', 'val_labels',
+               'test_images', 'test_labels', 'train_indices', 'val_indices')
+
+
+def cache_key(mean=MEAN, std=STD, test_size=0.2, random_state=42):
+    """Hash of everything the cached arrays depend on."""
+    params = {'mean': mean, 'std': std, 'test_size': test_size, 'random_state': random_state, 'version': 1}
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _atomic_save(path, array):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def prepare_cache(root='data/', cache_dir=None, mean=MEAN, std=STD, test_size=0.2, random_state=42):
+    """Write the normalized splits to ``.npy`` files unless already cached; return the cache path.
+
+    ``meta.json`` is written last, so a directory without it is an
+    interrupted run and gets rebuilt. Concurrent writers are harmless: every
+    file is renamed into place atomically and holds identical content.
+    """
+    path = os.path.join(cache_dir or os.path.join(root, 'cache'), cache_key(mean, std, test_size, random_state))
+    meta_path = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_path):
+        return path
+    os.makedirs(path, exist_ok=True)
+
+    images, labels = load_mnist(root, train=True)
+    test_images, test_labels = load_mnist(root, train=False)
+    train_indices, val_indices = split_indices(len(labels), test_size, random_state)
+    arrays = {
+        'train_images': normalize(images.index_select(0, train_indices), mean, std),
+        'train_labels': labels.index_select(0, train_indices),
+        'val_images': normalize(images.index_select(0, val_indices), mean, std),
+        'val_labels': labels.index_select(0, val_indices),
+        'test_images': normalize(test_images, mean, std),
+        'test_labels': test_labels,
+        'train_indices': train_indices,
+        'val_indices': val_indices,
+    }
+    for name in CACHE_FILES:
+        _atomic_save(os.path.join(path, name + '.npy'), arrays[name].numpy())
+
+    meta = {'mean': mean, 'std': std, 'test_size': test_size, 'random_state': random_state,
+            'sizes': {name: len(arrays[name]) for name in CACHE_FILES}}
+    tmp = '{}.{}.tmp'.format(meta_path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, meta_path)
+    return path
+
+
+def open_cache(path):
+    """Map every cached array as a tensor without copying it.
+
+    Copy-on-write mapping keeps the tensors writable (no ``from_numpy``
+    warning) while the pages stay shared until somebody writes to them.
+    """
+    return {name: torch.from_numpy(np.load(os.path.join(path, name + '.npy'), mmap_mode='c'))
+            for name in CACHE_FILES}
+
+
+def _cached_loaders(root, batch_size, test_size, random_state):
+    arrays = open_cache(prepare_cache(root, test_size=test_size, random_state=random_state))
+    return (TensorLoader(arrays['train_images'], arrays['train_labels'], batch_size, shuffle=True),
+            TensorLoader(arrays['val_images'], arrays['val_labels'], batch_size),
+            TensorLoader(arrays['test_images'], arrays['test_labels'], batch_size))
+
+
+def build_loaders(root='data/', batch_size=64, mode='tensor', test_size=0.2, random_state=42, pre_normalize=True):
+    """Return ``(dataloaders, dataset_sizes, testloader)`` as consumed by ``train_model``.
+
+    ``mode='torchvision'`` is the original per-sample transform pipeline.
+    ``mode='tensor'`` decodes every split once; with ``pre_normalize=False``
+    the images stay uint8 and are normalized batch by batch.
+    ``mode='mmap'`` serves the splits from the ``prepare_cache`` files.
+    """
+    if mode == 'torchvision':
+        trainloader, valloader, testloader = _torchvision_loaders(root, batch_size, test_size, random_state)
+    elif mode == 'tensor':
+        trainloader, valloader, testloader = _tensor_loaders(root, batch_size, test_size, random_state, pre_normalize)
+    elif mode == 'mmap':
+        trainloader, valloader, testloader = _cached_loaders(root, batch_size, test_size, random_state)
+    else:
+        raise ValueError('Unknown loader mode: {}'.format(mode))
+
+    dataloaders = {'train': trainloader, 'val': valloader}
+    dataset_sizes = {'train': len(trainloader.dataset), 'val': len(valloader.dataset)}
+    return dataloaders, dataset_sizes, testloader
+
+
+def time_epoch(loader):
+    """Seconds needed to draw every batch of ``loader`` once."""
+    start = time.perf_counter()
+    for inputs, labels in loader:
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    configs = [
+        ('torchvision', dict(mode='torchvision')),
+        ('tensor (float32)', dict(mode='tensor')),
+        ('tensor (uint8)', dict(mode='tensor', pre_normalize=False)),
+        ('mmap cache', dict(mode='mmap')),
+    ]
+    for name, kwargs in configs:
+        start = time.perf_counter()
+        dataloaders, dataset_sizes, testloader = build_loaders(**kwargs)
+        setup = time.perf_counter() - start
+        epochs = [time_epoch(dataloaders['train']) for _ in range(3)]
+        print('{:<18} setup {:6.2f}s  train epoch {:6.3f}s (best of 3)'.format(name, setup, min(epochs)))
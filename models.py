@@ -0,0 +1,276 @@
+"""Model definitions for the three architectures compared in ``code.py``.
+
+Kept free of data/plotting imports so training workers, benchmarks and
+inference code can import them without running the notebook.
+"""
+
+import copy
+import os
+
+import torch
+from torch import nn
+import torch.nn.functional as F
+
+
+class CNNFramework(nn.Module):
+    def __init__(self, width=1.0, channels=None):
+        super(CNNFramework, self).__init__()
+        # width scales both conv layers, e.g. 0.5 for a narrower distillation student;
+        # explicit per-layer channels (as left by pruning) take precedence
+        channels1, channels2 = channels or (int(32 * width), int(64 * width))
+        self.config = {'channels': (channels1, channels2)}
+        self.conv1 = nn.Conv2d(1, channels1, kernel_size=3, padding=1)
+        self.pool1 = nn.MaxPool2d(2, 2)
+        self.conv2 = nn.Conv2d(channels1, channels2, kernel_size=3, padding=1)
+        self.pool2 = nn.MaxPool2d(2, 2)
+        self.fc = nn.Linear(channels2 * 7 * 7, 10)
+
+    def forward(self, x):
+        x = self.pool1(F.relu(self.conv1(x)))
+        x = self.pool2(F.relu(self.conv2(x)))
+        x = torch.flatten(x, 1)  # [batch_size, channels2 * 7 * 7], also for channels_last inputs
+        x = self.fc(x)
+        return x
+
+
+class BranchingMergingCNN(nn.Module):
+    # Output channels of branch1, branch2, branch3, conv_merge, conv_post_merge and the hidden fc layer
+    CHANNELS = (32, 32, 32, 128, 128, 256)
+
+    def __init__(self, channels=None):
+        super(BranchingMergingCNN, self).__init__()
+        b1, b2, b3, merge, post_merge, hidden = channels or self.CHANNELS
+        self.config = {'channels': (b1, b2, b3, merge, post_merge, hidden)}
+        # Branch 1: Convolution with 3x3 kernel
+        self.branch1 = nn.Conv2d(1, b1, kernel_size=3, padding=1)
+        # Branch 2: Convolution with 5x5 kernel
+        self.branch2 = nn.Conv2d(1, b2, kernel_size=5, padding=2)
+        # Branch 3: Convolution with 7x7 kernel
+        self.branch3 = nn.Conv2d(1, b3, kernel_size=7, padding=3)
+
+        # Convolution layer after merging branches
+        self.conv_merge = nn.Sequential(
+            nn.Conv2d(b1 + b2 + b3, merge, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.MaxPool2d(kernel_size=2, stride=2)  # Downsample to reduce size
+        )
+
+        # Additional convolution layers after merging
+        self.conv_post_merge = nn.Sequential(
+            nn.Conv2d(merge, post_merge, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.MaxPool2d(kernel_size=2, stride=2)  # Further downsampling
+        )
+
+        # Fully connected layers
+        self.fc = nn.Sequential(
+            nn.Linear(post_merge * 7 * 7, hidden),
+            nn.ReLU(),
+            nn.Linear(hidden, 10)
+        )
+
+    def forward(self, x):
+        # Apply branch convolutions
+        b1 = F.relu(self.branch1(x))
+        b2 = F.relu(self.branch2(x))
+        b3 = F.relu(self.branch3(x))
+
+        # Merge branches
+        merged = torch.cat([b1, b2, b3], dim=1)  # Concatenate along the channel dimension
+        merged = self.conv_merge(merged)
+
+        # Further processing with additional convolution layers
+        post_merge = self.conv_post_merge(merged)
+
+        # Flatten and pass through fully connected layers
+        post_merge = torch.flatten(post_merge, 1)
+        out = self.fc(post_merge)
+
+        return out
+
+    def fuse_for_inference(self):
+        """Equivalent eval-mode model with the three branches folded into one conv.
+
+        Each branch is a linear conv over the same input with "same" padding,
+        so zero-padding the 3x3 and 5x5 kernels to 7x7 and stacking all
+        kernels along the output channels gives one 1->96 conv whose output
+        is exactly the concatenation the original builds with ``torch.cat``.
+        """
+        branches = [self.branch1, self.branch2, self.branch3]
+        size = max(branch.kernel_size[0] for branch in branches)
+        out_channels = sum(branch.out_channels for branch in branches)
+        stem = nn.Conv2d(self.branch1.in_channels, out_channels, kernel_size=size, padding=size // 2)
+        stem = stem.to(self.branch1.weight.device, self.branch1.weight.dtype)
+
+        with torch.no_grad():
+            stem.weight.zero_()
+            offset = 0
+            for branch in branches:
+                k = branch.kernel_size[0]
+                pad = (size - k) // 2
+                channels = slice(offset, offset + branch.out_channels)
+                stem.weight[channels, :, pad:pad + k, pad:pad + k] = branch.weight
+                stem.bias[channels] = branch.bias
+                offset += branch.out_channels
+
+        fused = FusedBranchingMergingCNN(stem, copy.deepcopy(self.conv_merge),
+                                         copy.deepcopy(self.conv_post_merge), copy.deepcopy(self.fc))
+        return fused.eval()
+
+
+class FusedBranchingMergingCNN(nn.Module):
+    """Inference form of ``BranchingMergingCNN`` produced by ``fuse_for_inference``."""
+
+    def __init__(self, stem, conv_merge, conv_post_merge, fc):
+        super(FusedBranchingMergingCNN, self).__init__()
+        self.stem = stem
+        self.conv_merge = conv_merge
+        self.conv_post_merge = conv_post_merge
+        self.fc = fc
+
+    def forward(self, x):
+        merged = self.conv_merge(F.relu(self.stem(x)))
+        post_merge = self.conv_post_merge(merged)
+        post_merge = torch.flatten(post_merge, 1)
+        return self.fc(post_merge)
+
+
+# Xavier initialization
+def init_weights(m):
+    if isinstance(m, nn.Conv2d) or isinstance(m, nn.Linear):
+        nn.init.xavier_uniform_(m.weight)
+
+
+def generate_mask(batch_size, img_size, mask_ratio=0.2):
+    mask = torch.rand(batch_size, img_size, img_size) < mask_ratio
+    return mask.unsqueeze(1)  # [batch_size, 1, img_size, img_size]
+
+
+class SelfAttention(nn.Module):
+    def __init__(self, in_channels, chunk_size=None, qk_channels=None):
+        super(SelfAttention, self).__init__()
+        # Query/key width; in_channels // 8 unless pruned
+        qk_channels = qk_channels or in_channels // 8
+        self.query = nn.Conv2d(in_channels, qk_channels, kernel_size=1)
+        self.key = nn.Conv2d(in_channels, qk_channels, kernel_size=1)
+        self.value = nn.Conv2d(in_channels, in_channels, kernel_size=1)
+        self.gamma = nn.Parameter(torch.zeros(1))
+        # Query positions per tile; None materializes the full [H*W, H*W] map
+        self.chunk_size = chunk_size
+
+    def forward(self, x):
+        batch_size, C, H, W = x.size()
+
+        # reshape, not view: conv outputs may be channels_last
+        query = self.query(x).reshape(batch_size, -1, H * W).permute(0, 2, 1)  # [batch_size, H*W, C//8]
+        key = self.key(x).reshape(batch_size, -1, H * W)  # [batch_size, C//8, H*W]
+        value = self.value(x).reshape(batch_size, -1, H * W)  # [batch_size, C, H*W]
+
+        if self.chunk_size is None or self.chunk_size >= H * W:
+            # calculate the weights (softmax in fp32 even under bf16 autocast)
+            energy = torch.bmm(query, key)  # [batch_size, H*W, H*W]
+            attention = torch.softmax(energy.float(), dim=-1).type_as(value)
+
+            # Use attention-weighted eigenvalues
+            out = torch.bmm(value, attention)  # [batch_size, C, H*W]
+        else:
+            out = self._tiled_attention(query, key, value)
+        out = out.view(batch_size, C, H, W)  # [batch_size, C, H, W]
+
+        return self.gamma * out + x
+
+    def _tiled_attention(self, query, key, value):
+        # value @ softmax(query @ key) contracts over the query positions and
+        # every softmax row is independent, so rows can be handled a tile at a
+        # time and their contributions summed. Peak memory is
+        # [batch, chunk_size, H*W] instead of [batch, H*W, H*W] (under autograd
+        # every tile is still saved for backward). Softmax and the running sum
+        # stay in fp32 so bf16 autocast does not accumulate rounding per tile.
+        out = value.new_zeros(value.size(0), value.size(1), key.size(2), dtype=torch.float32)
+        for start in range(0, query.size(1), self.chunk_size):
+            end = start + self.chunk_size
+            attention = torch.softmax(torch.bmm(query[:, start:end], key).float(), dim=-1)  # [batch_size, chunk, H*W]
+            out.baddbmm_(value[:, :, start:end].float(), attention)
+        return out.type_as(value)
+
+
+def set_attention_chunk_size(model, chunk_size):
+    """Switch every ``SelfAttention`` in ``model`` to tiled (or, with None, full) attention."""
+    for module in model.modules():
+        if isinstance(module, SelfAttention):
+            module.chunk_size = chunk_size
+    return model
+
+
+class MAGE_CNN(nn.Module):
+    CHANNELS = (64, 128, 256)
+
+    def __init__(self, attention_chunk_size=None, channels=None, qk_channels=None):
+        super(MAGE_CNN, self).__init__()
+        c1, c2, c3 = channels or self.CHANNELS
+        q1, q2, q3 = qk_channels or (c1 // 8, c2 // 8, c3 // 8)
+        self.config = {'channels': (c1, c2, c3), 'qk_channels': (q1, q2, q3)}
+        self.conv1 = nn.Conv2d(1, c1, kernel_size=3, padding=1)
+        self.pool1 = nn.MaxPool2d(2, 2)
+        self.att1 = SelfAttention(c1, attention_chunk_size, q1)
+
+        self.conv2 = nn.Conv2d(c1, c2, kernel_size=3, padding=1)
+        self.pool2 = nn.MaxPool2d(2, 2)
+        self.att2 = SelfAttention(c2, attention_chunk_size, q2)
+
+        self.conv3 = nn.Conv2d(c2, c3, kernel_size=3, padding=1)
+        self.pool3 = nn.MaxPool2d(2, 2)
+        self.att3 = SelfAttention(c3, attention_chunk_size, q3)
+
+        self.dropout = nn.Dropout(0.3)
+        self.fc = nn.Linear(c3 * 3 * 3, 10)  # Adjust based on the new feature map size
+
+    def forward(self, x, mask=None):
+        if mask is not None:
+            x = x * mask  # Apply mask
+
+        x = self.pool1(F.relu(self.conv1(x)))
+        x = self.att1(x)
+        x = self.pool2(F.relu(self.conv2(x)))
+        x = self.att2(x)
+        x = self.pool3(F.relu(self.conv3(x)))
+        x = self.att3(x)
+        x = torch.flatten(x, 1)  # [batch_size, c3 * 3 * 3]
+        x = self.dropout(x)
+        x = self.fc(x)
+        return x
+
+
+MODELS = {
+    'CNNFramework': CNNFramework,
+    'BranchingMergingCNN': BranchingMergingCNN,
+    'MAGE_CNN': MAGE_CNN,
+}
+
+
+def save_model(model, path):
+    """Save weights together with the class name and constructor ``config``, so ``load_model`` can rebuild it."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    torch.save({'model': type(model).__name__, 'config': getattr(model, 'config', {}),
+                'state_dict': model.state_dict()}, path)
+
+
+def load_model(path, map_location='cpu', mmap=False):
+    """Rebuild a model saved by ``save_model``, in eval mode.
+
+    ``mmap=True`` maps the file instead of reading it into memory first.
+    """
+    checkpoint = torch.load(path, map_location=map_location, mmap=mmap)
+    model = MODELS[checkpoint['model']](**checkpoint.get('config', {}))
+    model.load_state_dict(checkpoint['state_dict'])
+    return model.eval()
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters() if p.requires_grad)
+
+
+def max_output_error(reference, candidate, inputs):
+    """Largest absolute difference between two models' outputs on ``inputs``."""
+    with torch.no_grad():
+        return (reference(inputs).float() - candidate(inputs).float()).abs().max().item()
@@ -0,0 +1,172 @@
+"""Train the three architectures concurrently, one process per model.
+
+Each worker is pinned to its own slice of the available cores and limited to
+that many intra-op threads, so the models stop competing for the same cores.
+Core slices are sized by the rough relative cost of each model.
+
+    python parallel_runner.py --epochs 10 --compare --output runs/parallel.json
+
+``--precisions fp32 bf16`` repeats the run per precision and compares epoch
+time, test accuracy and peak RSS of every model.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from torch import nn, optim
+
+from benchmark import peak_rss_bytes
+from mnist_data import build_loaders, prepare_cache
+from models import MODELS, count_parameters
+from training import Trainer
+
+# Hyperparameters used for every model in code.py
+DEFAULT_CONFIG = {
+    'lr': 0.001,
+    'batch_size': 64,
+    'step_size': 5,
+    'gamma': 0.1,
+    'num_epochs': 10,
+    'use_mask': False,
+    'mask_ratio': 0.2,
+    'seed': 0,
+    'precision': 'fp32',
+}
+
+# Autocast dtype per precision name
+PRECISIONS = {'fp32': None, 'bf16': torch.bfloat16}
+
+# Relative training cost, used to size each worker's core slice
+COST_WEIGHTS = {'CNNFramework': 1, 'BranchingMergingCNN': 3, 'MAGE_CNN': 4}
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def partition_cores(cores, weights):
+    """Split ``cores`` into contiguous slices proportional to ``weights`` (at least one core each)."""
+    if len(cores) < len(weights):
+        return [[cores[i % len(cores)]] for i in range(len(weights))]
+    sizes = [1] * len(weights)
+    spare = len(cores) - len(weights)
+    total = float(sum(weights))
+    shares = [spare * w / total for w in weights]
+    for i, share in enumerate(shares):
+        sizes[i] += int(share)
+    # Hand out what rounding left over to the largest remainders
+    leftover = len(cores) - sum(sizes)
+    for i in sorted(range(len(weights)), key=lambda i: shares[i] - int(shares[i]), reverse=True)[:leftover]:
+        sizes[i] += 1
+    groups, start = [], 0
+    for size in sizes:
+        groups.append(cores[start:start + size])
+        start += size
+    return groups
+
+
+def train_one(model_name, config, cores=None, num_threads=None):
+    """Train one model with the notebook recipe; returns its ``metrics`` dict."""
+    if cores is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    torch.manual_seed(config['seed'])
+
+    dataloaders, dataset_sizes, testloader = build_loaders(mode='mmap', batch_size=config['batch_size'])
+    model = MODELS[model_name]()
+    optimizer = optim.AdamW(model.parameters(), lr=config['lr'])
+    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=config['step_size'], gamma=config['gamma'])
+    trainer = Trainer(model, nn.CrossEntropyLoss(), optimizer, scheduler,
+                      use_mask=config['use_mask'], mask_ratio=config['mask_ratio'], verbose=False,
+                      amp_dtype=PRECISIONS[config['precision']])
+
+    since = time.time()
+    history = trainer.fit(dataloaders, config['num_epochs'])
+    metrics = dict(history)
+    metrics['train_time'] = time.time() - since
+    metrics['epoch_time'] = metrics['train_time'] / max(config['num_epochs'], 1)
+    metrics['test_accuracy'] = trainer.evaluate(testloader)
+    metrics['parameter_count'] = count_parameters(model)
+    metrics['num_threads'] = torch.get_num_threads()
+    metrics['cores'] = list(cores) if cores is not None else None
+    metrics['precision'] = config['precision']
+    metrics['peak_rss_bytes'] = peak_rss_bytes()
+    return metrics
+
+
+def _run(jobs):
+    # One single-worker pool per job, so no worker can pick up two jobs
+    context = mp.get_context('spawn')
+    pools = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in jobs]
+    try:
+        futures = [pool.submit(train_one, *job) for pool, job in zip(pools, jobs)]
+        return [future.result() for future in futures]
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+
+def run_parallel(model_names, config, cores=None):
+    """Train all models at once, each pinned to its own core slice."""
+    cores = cores or available_cores()
+    groups = partition_cores(cores, [COST_WEIGHTS.get(name, 1) for name in model_names])
+    return dict(zip(model_names, _run([(name, config, group, len(group)) for name, group in zip(model_names, groups)])))
+
+
+def run_sequential(model_names, config, cores=None):
+    """Train the models one after another, each with every core."""
+    cores = cores or available_cores()
+    results = {}
+    for name in model_names:
+        results[name] = _run([(name, config, cores, len(cores))])[0]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--epochs', type=int, default=DEFAULT_CONFIG['num_epochs'])
+    parser.add_argument('--compare', action='store_true', help='also run the models sequentially')
+    parser.add_argument('--precisions', nargs='+', default=['fp32'], choices=list(PRECISIONS))
+    parser.add_argument('--output', help='write the collected metrics to this JSON file')
+    args = parser.parse_args()
+
+    # Build the shared cache once, before the workers map it
+    prepare_cache()
+
+    report = {'cores': len(available_cores()), 'runs': {}}
+    modes = [('parallel', run_parallel)] + ([('sequential', run_sequential)] if args.compare else [])
+    for precision in args.precisions:
+        config = dict(DEFAULT_CONFIG, num_epochs=args.epochs, precision=precision)
+        for mode, run in modes:
+            start = time.time()
+            results = run(args.models, config)
+            wall = time.time() - start
+            report['runs']['{}/{}'.format(mode, precision)] = {'config': config, 'wall_clock': wall,
+                                                               'results': results}
+            print('{:<10} {:<5} wall-clock {:7.1f}s'.format(mode, precision, wall))
+            for name, metrics in results.items():
+                print('    {:<20} {:3d} threads  epoch {:6.1f}s  test acc {:.4f}  peak RSS {:6.0f} MiB'.format(
+                    name, metrics['num_threads'], metrics['epoch_time'], metrics['test_accuracy'],
+                    metrics['peak_rss_bytes'] / 2 ** 20))
+        if args.compare:
+            runs = report['runs']
+            print('speed-up ({}): {:.2f}x'.format(precision, runs['sequential/' + precision]['wall_clock'] /
+                                                  runs['parallel/' + precision]['wall_clock']))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Lean command-line digit classifier.
+
+Imports only torch and ``models`` (no torchvision, sklearn, matplotlib or
+numpy-side data code), maps the checkpoint with ``torch.load(mmap=True)``
+and decodes 28x28 PNG, PGM or raw 784-byte images itself.
+
+    python predict.py checkpoints/CNNFramework.pt digit.png other.pgm
+    cat digits.raw | python predict.py checkpoints/CNNFramework.pt --timings
+
+Budget, measured from the first statement of this module on CPU: importing
+it must take at most ``IMPORT_BUDGET`` seconds (essentially ``import
+torch``), and the first prediction must be printed within
+``FIRST_PREDICTION_BUDGET`` seconds. ``--check-budget`` exits with status 1
+when either is exceeded or a heavy module got imported.
+"""
+
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import struct
+import sys
+import zlib
+
+import torch
+
+from models import load_model
+
+IMPORT_SECONDS = time.perf_counter() - _START
+
+IMPORT_BUDGET = 1.5
+FIRST_PREDICTION_BUDGET = 2.0
+# Modules whose presence means something pulled in the training/plotting stack
+HEAVY_MODULES = ('torchvision', 'sklearn', 'matplotlib', 'mnist_data', 'training')
+
+IMAGE_SIZE = 28
+# Same normalization as mnist_data.normalize
+MEAN = 0.5
+STD = 0.5
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def decode_png(data):
+    """Grayscale uint8 ``[H, W]`` tensor from an 8-bit, non-interlaced PNG (gray, RGB, with or without alpha)."""
+    pos, idat = len(PNG_SIGNATURE), []
+    width = height = depth = color = interlace = None
+    try:
+        while pos < len(data):
+            length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+            chunk = data[pos + 8:pos + 8 + length]
+            pos += length + 12
+            if kind == b'IHDR':
+                width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', chunk)
+            elif kind == b'IDAT':
+                idat.append(chunk)
+            elif kind == b'IEND':
+                break
+    except struct.error:
+        raise ValueError('truncated PNG chunk')
+    if width is None:
+        raise ValueError('PNG has no IHDR chunk')
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color)
+    if depth != 8 or interlace or channels is None:
+        raise ValueError('only 8-bit, non-interlaced, non-palette PNGs are supported')
+
+    raw = zlib.decompress(b''.join(idat))
+    stride = width * channels
+    pixels = bytearray()
+    prev = bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        kind, line = raw[start], bytearray(raw[start + 1:start + 1 + stride])
+        for i in range(stride):
+            a = line[i - channels] if i >= channels else 0
+            b = prev[i]
+            c = prev[i - channels] if i >= channels else 0
+            if kind == 1:
+                line[i] = (line[i] + a) & 0xFF
+            elif kind == 2:
+                line[i] = (line[i] + b) & 0xFF
+            elif kind == 3:
+                line[i] = (line[i] + (a + b) // 2) & 0xFF
+            elif kind == 4:
+                line[i] = (line[i] + _paeth(a, b, c)) & 0xFF
+        pixels += line
+        prev = line
+
+    image = torch.frombuffer(pixels, dtype=torch.uint8).view(height, width, channels)
+    if channels < 3:
+        return image[..., 0].clone()
+    luma = image[..., :3].float() @ torch.tensor([0.299, 0.587, 0.114])
+    return luma.round_().to(torch.uint8)
+
+
+def decode_pgm(data):
+    """uint8 ``[H, W]`` tensor from a binary (P5) or ASCII (P2) PGM."""
+    fields, pos = [], 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos)
+            continue
+        end = pos
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic == b'P5':
+        if maxval > 255:
+            raise ValueError('16-bit PGMs are not supported')
+        # Exactly one whitespace byte separates the header from the pixels
+        values = torch.frombuffer(bytearray(data[pos + 1:pos + 1 + width * height]), dtype=torch.uint8)
+    elif magic == b'P2':
+        values = torch.tensor([int(v) for v in data[pos:].split()[:width * height]])
+    else:
+        raise ValueError('not a PGM file')
+    if maxval != 255:
+        values = (values.float() * (255.0 / maxval)).round_().to(torch.uint8)
+    return values.to(torch.uint8).view(height, width)
+
+
+def decode_images(data):
+    """uint8 ``[N, 28, 28]`` batch from one PNG/PGM file or ``N`` concatenated raw 784-byte images."""
+    if data.startswith(PNG_SIGNATURE):
+        images = decode_png(data).unsqueeze(0)
+    elif data[:2] in (b'P5', b'P2'):
+        images = decode_pgm(data).unsqueeze(0)
+    elif data and len(data) % (IMAGE_SIZE * IMAGE_SIZE) == 0:
+        images = torch.frombuffer(bytearray(data), dtype=torch.uint8).view(-1, IMAGE_SIZE, IMAGE_SIZE)
+    else:
+        raise ValueError('expected a PNG, a PGM or raw 28x28 uint8 images')
+    if images.shape[1:] != (IMAGE_SIZE, IMAGE_SIZE):
+        raise ValueError('expected 28x28 images, got {}x{}'.format(images.shape[2], images.shape[1]))
+    return images
+
+
+def load(path):
+    """A ``save_model`` checkpoint (memory-mapped) or a TorchScript ``.ts`` artifact, in eval mode."""
+    if path.endswith('.ts'):
+        return torch.jit.load(path, map_location='cpu').eval()
+    try:
+        return load_model(path, mmap=True)
+    except RuntimeError:
+        # mmap needs the zip serialization format; older files are read normally
+        return load_model(path)
+
+
+def predict(model, images, invert=False):
+    """``(labels, confidences)`` for uint8 ``images`` of shape ``[N, 28, 28]``."""
+    if invert:
+        images = 255 - images
+    inputs = images.float().div_(255).sub_(MEAN).div_(STD).unsqueeze(1)
+    with torch.inference_mode():
+        confidences, labels = torch.softmax(model(inputs), dim=1).max(1)
+    return labels.tolist(), confidences.tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify 28x28 digit images with a saved model.')
+    parser.add_argument('checkpoint')
+    parser.add_argument('images', nargs='*', help="PNG/PGM/raw files; none or '-' reads stdin")
+    parser.add_argument('--invert', action='store_true', help='images are dark digits on a light background')
+    parser.add_argument('--timings', action='store_true', help='report import and first-prediction times')
+    parser.add_argument('--check-budget', action='store_true', help='exit 1 if a startup budget is exceeded')
+    args = parser.parse_args()
+
+    model = load(args.checkpoint)
+    first_prediction = None
+    for name in args.images or ['-']:
+        if name == '-':
+            data = sys.stdin.buffer.read()
+        else:
+            with open(name, 'rb') as f:
+                data = f.read()
+        labels, confidences = predict(model, decode_images(data), args.invert)
+        for i, (label, confidence) in enumerate(zip(labels, confidences)):
+            print('{}\t{}\t{:.4f}'.format(name if len(labels) == 1 else '{}[{}]'.format(name, i),
+                                         label, confidence), flush=first_prediction is None)
+            if first_prediction is None:
+                first_prediction = time.perf_counter() - _START
+
+    heavy = [module for module in HEAVY_MODULES if module in sys.modules]
+    within_budget = (IMPORT_SECONDS <= IMPORT_BUDGET and not heavy and
+                     (first_prediction or 0.0) <= FIRST_PREDICTION_BUDGET)
+    if args.timings or args.check_budget:
+        print('import {:.3f}s (budget {}s)  first prediction {:.3f}s (budget {}s){}'.format(
+            IMPORT_SECONDS, IMPORT_BUDGET, first_prediction or 0.0, FIRST_PREDICTION_BUDGET,
+            '  heavy imports: ' + ', '.join(heavy) if heavy else ''), file=sys.stderr)
+    if args.check_budget and not within_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Per-layer profiling of the models in ``models.py``.
+
+``LayerProfiler`` hooks the forward and backward pass of every submodule and
+accumulates wall time, output activation size and (on CUDA) the change in
+allocated memory per layer. Given to ``Trainer(profiler=...)`` it also splits
+each step into data-loading and compute time. Nothing is hooked or timed
+unless a profiler is created, so the default training path is unchanged.
+
+    python profiling.py --model MAGE_CNN --steps 50 --trace runs/mage_trace.json
+
+``--trace`` writes the hook timings as a Chrome trace (chrome://tracing or
+Perfetto); ``--torch-trace`` additionally runs the same steps under
+``torch.profiler`` and exports its operator-level trace.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import torch
+
+# Chrome-trace thread per kind of event
+TRACE_TIDS = {'forward': 0, 'backward': 1, 'data': 2, 'compute': 3}
+
+
+def _nbytes(value):
+    if torch.is_tensor(value):
+        return value.numel() * value.element_size()
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+class LayerProfiler:
+    """Forward/backward hooks on every submodule of ``model`` that attribute time and memory per layer.
+
+    On CUDA every hook synchronizes the device so that time lands on the
+    layer that spent it; memory deltas come from ``torch.cuda.memory_allocated``
+    and are None on CPU (use ``profile_with_torch`` for CPU memory).
+    ``trace=True`` keeps every event for ``export_chrome_trace``.
+    """
+
+    def __init__(self, model, trace=False):
+        self.model = model
+        self.trace = trace
+        self.device = next(model.parameters()).device
+        self.stats = {}
+        self.phases = {}
+        self.events = []
+        self._start = {}
+        self._handles = []
+        self.attach()
+
+    def _now(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        return time.perf_counter_ns()
+
+    def _memory(self):
+        return torch.cuda.memory_allocated(self.device) if self.device.type == 'cuda' else None
+
+    def _pre_hook(self, name, kind):
+        def hook(module, *args):
+            self._start[name, kind] = (self._now(), self._memory())
+        return hook
+
+    def _post_hook(self, name, kind):
+        def hook(module, inputs, outputs):
+            end = self._now()
+            start, memory = self._start.pop((name, kind))
+            stat = self.stats[name]
+            stat[kind + '_ns'] += end - start
+            stat[kind + '_calls'] += 1
+            if kind == 'forward':
+                stat['activation_bytes'] = _nbytes(outputs)
+                if memory is not None:
+                    stat['memory_bytes'] = max(stat['memory_bytes'] or 0, self._memory() - memory)
+            if self.trace:
+                self.events.append((name, kind, start, end - start))
+        return hook
+
+    def attach(self):
+        for name, module in self.model.named_modules():
+            name = name or type(self.model).__name__
+            self.stats[name] = {'forward_ns': 0, 'forward_calls': 0, 'backward_ns': 0, 'backward_calls': 0,
+                                'activation_bytes': 0, 'memory_bytes': None}
+            self._handles += [
+                module.register_forward_pre_hook(self._pre_hook(name, 'forward')),
+                module.register_forward_hook(self._post_hook(name, 'forward')),
+                module.register_full_backward_pre_hook(self._pre_hook(name, 'backward')),
+                module.register_full_backward_hook(self._post_hook(name, 'backward')),
+            ]
+
+    def remove(self):
+        """Detach every hook; the collected statistics stay available."""
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.remove()
+
+    def time_loader(self, loader, phase):
+        """Yield ``loader``'s batches, charging time in ``next()`` to data and the rest to compute."""
+        totals = self.phases.setdefault(phase, {'data_ns': 0, 'compute_ns': 0, 'steps': 0})
+        iterator = iter(loader)
+        while True:
+            start = self._now()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            fetched = self._now()
+            yield batch
+            end = self._now()
+            totals['data_ns'] += fetched - start
+            totals['compute_ns'] += end - fetched
+            totals['steps'] += 1
+            if self.trace:
+                self.events += [(phase, 'data', start, fetched - start), (phase, 'compute', fetched, end - fetched)]
+
+    def report(self, limit=None):
+        """Layers sorted by forward + backward time, followed by the data/compute split per phase."""
+        # The root module's time spans the whole forward/backward pass
+        root = self.stats[type(self.model).__name__]
+        total = (root['forward_ns'] + root['backward_ns']) or 1
+        rows = sorted(self.stats.items(), key=lambda item: item[1]['forward_ns'] + item[1]['backward_ns'],
+                      reverse=True)
+        lines = ['{:<28} {:>7} {:>11} {:>11} {:>7} {:>12} {:>12}'.format(
+            'layer', 'calls', 'fwd ms/call', 'bwd ms/call', '% time', 'activation', 'alloc delta')]
+        for name, stat in rows[:limit]:
+            lines.append('{:<28} {:>7} {:>11.3f} {:>11.3f} {:>6.1f}% {:>9.1f}KiB {:>12}'.format(
+                name, stat['forward_calls'],
+                stat['forward_ns'] / max(stat['forward_calls'], 1) / 1e6,
+                stat['backward_ns'] / max(stat['backward_calls'], 1) / 1e6,
+                100.0 * (stat['forward_ns'] + stat['backward_ns']) / total,
+                stat['activation_bytes'] / 1024,
+                '-' if stat['memory_bytes'] is None else '{:.1f}KiB'.format(stat['memory_bytes'] / 1024)))
+        for phase, totals in self.phases.items():
+            busy = (totals['data_ns'] + totals['compute_ns']) or 1
+            lines.append('{:<6} {:6d} steps  data {:8.1f}ms ({:4.1f}%)  compute {:8.1f}ms'.format(
+                phase, totals['steps'], totals['data_ns'] / 1e6, 100.0 * totals['data_ns'] / busy,
+                totals['compute_ns'] / 1e6))
+        return '\n'.join(lines)
+
+    def export_chrome_trace(self, path):
+        """Write the recorded events (``trace=True``) in Chrome trace-event format."""
+        origin = min((start for _, _, start, _ in self.events), default=0)
+        events = [{'name': name, 'cat': kind, 'ph': 'X', 'pid': 0, 'tid': TRACE_TIDS[kind],
+                   'ts': (start - origin) / 1e3, 'dur': duration / 1e3}
+                  for name, kind, start, duration in self.events]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def profile_with_torch(trainer, loader, path, steps=20):
+    """Run ``steps`` training steps under ``torch.profiler``, export its Chrome trace, return its table."""
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if trainer.device.type == 'cuda':
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True) as prof:
+        trainer.run_epoch(list(itertools.islice(loader, steps)), train=True)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    prof.export_chrome_trace(path)
+    return prof.key_averages().table(sort_by='self_cpu_time_total', row_limit=25)
+
+
+def main():
+    from torch import nn, optim
+
+    from mnist_data import build_loaders
+    from models import MODELS
+    from training import Trainer
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', default='MAGE_CNN', choices=list(MODELS))
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--trace', help='write the per-layer hook timings as a Chrome trace')
+    parser.add_argument('--torch-trace', help='also export a torch.profiler trace of the same steps')
+    args = parser.parse_args()
+
+    dataloaders, _, _ = build_loaders(mode='mmap', batch_size=args.batch_size)
+    loader = itertools.islice(dataloaders['train'], args.steps)
+    model = MODELS[args.model]()
+    optimizer = optim.AdamW(model.parameters(), lr=0.001)
+
+    with LayerProfiler(model, trace=args.trace is not None) as profiler:
+        trainer = Trainer(model, nn.CrossEntropyLoss(), optimizer, verbose=False, profiler=profiler)
+        trainer.run_epoch(loader, train=True)
+    print(profiler.report())
+    if args.trace:
+        profiler.export_chrome_trace(args.trace)
+
+    if args.torch_trace:
+        trainer.profiler = None
+        print(profile_with_torch(trainer, dataloaders['train'], args.torch_trace, args.steps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""Structured channel pruning of the models in ``models.py``.
+
+Each architecture is described as a list of channel groups. A group is the
+set of output channels one layer produces, together with every tensor
+dimension that consumes them: the next conv's input channels, the
+``flatten -> fc`` columns (one per channel and spatial position), or, in
+``MAGE_CNN``, the ``SelfAttention`` query/key/value inputs and the residual
+``value`` output. Channels are ranked by the L1 norm of their producing
+weights; ``prune`` keeps the top ``1 - ratio`` of every group and rebuilds a
+physically smaller model from the sliced state dict.
+
+    python pruning.py checkpoints/MAGE_CNN.pt --ratios 0 0.25 0.5 0.75 --epochs 2 --plot runs/mage_pruning.png
+"""
+
+import argparse
+import collections
+import json
+import os
+
+import torch
+from torch import nn, optim
+
+from benchmark import measure_inference_time
+from cost_model import estimate_cost
+from evaluation import evaluate
+from models import SelfAttention, count_parameters, load_model, save_model
+from training import Trainer
+
+# ``key``/``position`` locate the group's size in ``model.config``; ``slices``
+# are (tensor, dim, channel offset, spatial positions per channel)
+Group = collections.namedtuple('Group', ['key', 'position', 'producers', 'slices'])
+
+
+def _outputs(name):
+    # A conv/linear layer's own weight rows and bias
+    return [(name + '.weight', 0, 0, 1), (name + '.bias', 0, 0, 1)]
+
+
+def _cnn_groups(model):
+    return [
+        Group('channels', 0, ['conv1.weight'], _outputs('conv1') + [('conv2.weight', 1, 0, 1)]),
+        Group('channels', 1, ['conv2.weight'], _outputs('conv2') + [('fc.weight', 1, 0, 7 * 7)]),
+    ]
+
+
+def _branching_groups(model):
+    b1, b2, _, _, _, _ = model.config['channels']
+    return [
+        # The branches are concatenated, so each one owns a slice of conv_merge's input channels
+        Group('channels', 0, ['branch1.weight'], _outputs('branch1') + [('conv_merge.0.weight', 1, 0, 1)]),
+        Group('channels', 1, ['branch2.weight'], _outputs('branch2') + [('conv_merge.0.weight', 1, b1, 1)]),
+        Group('channels', 2, ['branch3.weight'], _outputs('branch3') + [('conv_merge.0.weight', 1, b1 + b2, 1)]),
+        Group('channels', 3, ['conv_merge.0.weight'],
+              _outputs('conv_merge.0') + [('conv_post_merge.0.weight', 1, 0, 1)]),
+        Group('channels', 4, ['conv_post_merge.0.weight'],
+              _outputs('conv_post_merge.0') + [('fc.0.weight', 1, 0, 7 * 7)]),
+        Group('channels', 5, ['fc.0.weight'], _outputs('fc.0') + [('fc.2.weight', 1, 0, 1)]),
+    ]
+
+
+def _mage_groups(model):
+    groups = []
+    consumers = [('conv2.weight', 1, 0, 1), ('conv3.weight', 1, 0, 1), ('fc.weight', 1, 0, 3 * 3)]
+    for i, consumer in enumerate(consumers):
+        conv, att = 'conv{}'.format(i + 1), 'att{}'.format(i + 1)
+        # gamma * value(x) + x: the attention block keeps its input's channels, so
+        # they are pruned together with the conv that produces them
+        groups.append(Group('channels', i, [conv + '.weight', att + '.value.weight'],
+                            _outputs(conv) + _outputs(att + '.value') + [
+                                (att + '.query.weight', 1, 0, 1), (att + '.key.weight', 1, 0, 1),
+                                (att + '.value.weight', 1, 0, 1), consumer]))
+        # energy sums query_c * key_c over c, so query and key channels go in pairs
+        groups.append(Group('qk_channels', i, [att + '.query.weight', att + '.key.weight'],
+                            _outputs(att + '.query') + _outputs(att + '.key')))
+    return groups
+
+
+GROUPS = {
+    'CNNFramework': _cnn_groups,
+    'BranchingMergingCNN': _branching_groups,
+    'MAGE_CNN': _mage_groups,
+}
+
+
+def _l1(weight):
+    return weight.detach().float().flatten(1).abs().sum(1)
+
+
+def channel_saliency(state, producers):
+    """Per-channel L1 norm summed over ``producers``, each normalized to mean 1."""
+    return sum(_l1(state[name]) / _l1(state[name]).mean().clamp(min=1e-12) for name in producers)
+
+
+def prune(model, ratio):
+    """A smaller copy of ``model`` with the lowest-saliency ``ratio`` of every channel group removed."""
+    state = model.state_dict()
+    config = {key: list(value) for key, value in model.config.items()}
+    index = {}
+    for group in GROUPS[type(model).__name__](model):
+        saliency = channel_saliency(state, group.producers)
+        keep = saliency.topk(max(1, int(round(len(saliency) * (1 - ratio))))).indices.sort().values
+        config[group.key][group.position] = len(keep)
+        for name, dim, offset, spatial in group.slices:
+            # flatten() lays out channel c as columns [c * spatial, (c + 1) * spatial)
+            columns = (keep.unsqueeze(1) * spatial + torch.arange(spatial)).flatten()
+            index.setdefault((name, dim), []).append(columns + offset * spatial)
+
+    pruned_state = {}
+    for name, tensor in state.items():
+        for dim in range(tensor.dim()):
+            if (name, dim) in index:
+                tensor = tensor.index_select(dim, torch.cat(index[name, dim]).sort().values.to(tensor.device))
+        pruned_state[name] = tensor
+
+    pruned = type(model)(**{key: tuple(value) for key, value in config.items()})
+    pruned.load_state_dict(pruned_state)
+    for source, target in zip(model.modules(), pruned.modules()):
+        if isinstance(source, SelfAttention):
+            target.chunk_size = source.chunk_size
+    return pruned.to(next(model.parameters()).device)
+
+
+def fine_tune(model, dataloaders, num_epochs=2, lr=1e-4):
+    """Recover accuracy after pruning with the regular training loop; keeps the best-val weights."""
+    optimizer = optim.AdamW(model.parameters(), lr=lr)
+    Trainer(model, nn.CrossEntropyLoss(), optimizer, verbose=False).fit(dataloaders, num_epochs)
+    return model
+
+
+def tradeoff(model, dataloaders, testloader, ratios=(0.0, 0.25, 0.5, 0.75), num_epochs=2, save_dir=None):
+    """Prune ``model`` at every ratio, fine-tune, and measure accuracy, latency, params and MACs."""
+    device = next(model.parameters()).device
+    records = []
+    for ratio in ratios:
+        pruned = prune(model, ratio) if ratio else model
+        if ratio and num_epochs:
+            fine_tune(pruned, dataloaders, num_epochs)
+        pruned.eval()
+        record = {
+            'ratio': ratio,
+            'channels': pruned.config,
+            'test_accuracy': evaluate(pruned, testloader, device)['accuracy'],
+            'latency_per_image': measure_inference_time(pruned, testloader, device),
+            'parameter_count': count_parameters(pruned),
+            'macs': estimate_cost(pruned)['macs'],
+        }
+        records.append(record)
+        print('ratio {ratio:4.2f}  test acc {test_accuracy:.4f}  {us:7.1f} us/image  {parameter_count:9,d} params  '
+              '{mmacs:7.2f} MMACs'.format(us=record['latency_per_image'] * 1e6, mmacs=record['macs'] / 1e6, **record))
+        if save_dir:
+            save_model(pruned, os.path.join(save_dir, '{}_pruned_{:02.0f}.pt'.format(
+                type(pruned).__name__, ratio * 100)))
+    return records
+
+
+def plot_tradeoff(records, path, title):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5))
+    accuracy = [record['test_accuracy'] for record in records]
+    for ax, key, label in [(axes[0], 'latency_per_image', 'Latency per image (us)'),
+                           (axes[1], 'parameter_count', 'Parameters')]:
+        scale = 1e6 if key == 'latency_per_image' else 1
+        ax.plot([record[key] * scale for record in records], accuracy, marker='o')
+        for record in records:
+            ax.annotate('{:.0%}'.format(record['ratio']), (record[key] * scale, record['test_accuracy']),
+                        textcoords='offset points', xytext=(5, 5))
+        ax.set_xlabel(label)
+        ax.set_ylabel('Test accuracy')
+        ax.grid(True, linestyle='--', alpha=0.6)
+    fig.suptitle(title)
+    fig.tight_layout()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.savefig(path)
+
+
+def main():
+    from mnist_data import build_loaders
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('checkpoint')
+    parser.add_argument('--ratios', type=float, nargs='+', default=[0.0, 0.25, 0.5, 0.75])
+    parser.add_argument('--epochs', type=int, default=2, help='fine-tuning epochs per ratio')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--save-dir', help='save every pruned, fine-tuned model here')
+    parser.add_argument('--plot', help='write the accuracy/latency/params curves to this image')
+    parser.add_argument('--output', help='write the records to this JSON file')
+    args = parser.parse_args()
+
+    dataloaders, _, testloader = build_loaders(mode='mmap')
+    model = load_model(args.checkpoint, map_location=args.device)
+    records = tradeoff(model, dataloaders, testloader, args.ratios, args.epochs, args.save_dir)
+    if args.plot:
+        plot_tradeoff(records, args.plot, '{} channel pruning'.format(type(model).__name__))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
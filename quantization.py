@@ -0,0 +1,157 @@
+"""Post-training int8 quantization of the trained models.
+
+Conv blocks are quantized statically with FX graph mode, calibrated on a
+slice of the validation split; Linear layers are then quantized dynamically
+(int8 weights, activations quantized on the fly). ``SelfAttention`` is kept in
+fp32: its modules are marked non-traceable and get no qconfig, so FX
+dequantizes in front of each attention block and requantizes after it.
+
+    python quantization.py checkpoints/*.pt --calibration-batches 32 --export exported/
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+
+import torch
+from torch import nn
+from torch.ao.quantization import QConfigMapping, get_default_qconfig, quantize_dynamic
+from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from benchmark import percentile, time_forward
+from models import SelfAttention, load_model
+
+
+class _Inference(nn.Module):
+    # Calls the model with its default arguments only, so FX never traces
+    # MAGE_CNN's optional ``mask`` branch
+    def __init__(self, model):
+        super(_Inference, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x)
+
+
+def default_backend():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ['x86', 'fbgemm', 'qnnpack']:
+        if engine in engines:
+            return engine
+    raise RuntimeError('No quantized engine available in this torch build')
+
+
+def quantize_model(model, calibration_batches, backend=None):
+    """int8 copy of ``model``: static convs, dynamic Linear layers, fp32 attention. CPU only."""
+    backend = backend or default_backend()
+    torch.backends.quantized.engine = backend
+    wrapped = _Inference(copy.deepcopy(model).cpu().eval())
+
+    attention = [name for name, module in wrapped.named_modules() if isinstance(module, SelfAttention)]
+    qconfig_mapping = QConfigMapping().set_global(get_default_qconfig(backend))
+    # Linear layers are left to quantize_dynamic below
+    qconfig_mapping.set_object_type(nn.Linear, None)
+    for name in attention:
+        qconfig_mapping.set_module_name(name, None)
+    prepare_config = PrepareCustomConfig().set_non_traceable_module_names(attention)
+
+    prepared = prepare_fx(wrapped, qconfig_mapping, (calibration_batches[0],),
+                          prepare_custom_config=prepare_config)
+    with torch.no_grad():
+        for inputs in calibration_batches:
+            prepared(inputs)
+    quantized = convert_fx(prepared)
+    return quantize_dynamic(quantized, {nn.Linear}, dtype=torch.qint8)
+
+
+def calibration_slice(valloader, num_batches):
+    batches = []
+    for inputs, _ in valloader:
+        batches.append(inputs.cpu())
+        if len(batches) == num_batches:
+            break
+    return batches
+
+
+def accuracy(model, loader):
+    correct = total = 0
+    with torch.inference_mode():
+        for inputs, labels in loader:
+            correct += (model(inputs).argmax(1) == labels).sum().item()
+            total += labels.size(0)
+    return correct / total
+
+
+def serialized_size(model):
+    """Bytes ``torch.save`` needs for the state_dict, i.e. the model's size on disk."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def latency_ms(model, batch_size, iters=50):
+    samples = sorted(time_forward(model, torch.randn(batch_size, 1, 28, 28), warmup=10, iters=iters))
+    return percentile(samples, 50) / 1e6
+
+
+def report(model, quantized, testloader, batch_sizes=(1, 64)):
+    """Accuracy delta, size on disk and p50 latency of ``quantized`` vs. the fp32 ``model``."""
+    model = model.cpu().eval()
+    fp32_acc, int8_acc = accuracy(model, testloader), accuracy(quantized, testloader)
+    result = {
+        'fp32_accuracy': fp32_acc,
+        'int8_accuracy': int8_acc,
+        'accuracy_delta': int8_acc - fp32_acc,
+        'fp32_bytes': serialized_size(model),
+        'int8_bytes': serialized_size(quantized),
+    }
+    for batch_size in batch_sizes:
+        result['fp32_p50_ms_bs{}'.format(batch_size)] = latency_ms(model, batch_size)
+        result['int8_p50_ms_bs{}'.format(batch_size)] = latency_ms(quantized, batch_size)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize checkpoints saved by models.save_model to int8.')
+    parser.add_argument('checkpoints', nargs='+')
+    parser.add_argument('--calibration-batches', type=int, default=32, help='val batches of 64 used to calibrate')
+    parser.add_argument('--backend', help='quantized engine (default: x86, fbgemm or qnnpack)')
+    parser.add_argument('--export', help='directory to save the quantized models as TorchScript')
+    parser.add_argument('--output', help='write the report to this JSON file')
+    args = parser.parse_args()
+
+    from mnist_data import build_loaders
+
+    dataloaders, _, testloader = build_loaders(mode='mmap', batch_size=64)
+    calibration = calibration_slice(dataloaders['val'], args.calibration_batches)
+
+    results = {}
+    for path in args.checkpoints:
+        model = load_model(path)
+        name = type(model).__name__
+        quantized = quantize_model(model, calibration, args.backend)
+        results[name] = report(model, quantized, testloader)
+        r = results[name]
+        print('{:<20} acc {:.4f} -> {:.4f} ({:+.4f})  size {:7.1f} -> {:7.1f} KiB  '
+              'p50 bs=1 {:.3f} -> {:.3f} ms  bs=64 {:.3f} -> {:.3f} ms'.format(
+                  name, r['fp32_accuracy'], r['int8_accuracy'], r['accuracy_delta'],
+                  r['fp32_bytes'] / 1024, r['int8_bytes'] / 1024,
+                  r['fp32_p50_ms_bs1'], r['int8_p50_ms_bs1'], r['fp32_p50_ms_bs64'], r['int8_p50_ms_bs64']))
+
+        if args.export:
+            os.makedirs(args.export, exist_ok=True)
+            with torch.no_grad():
+                scripted = torch.jit.freeze(torch.jit.trace(quantized, calibration[0]))
+            torch.jit.save(scripted, os.path.join(args.export, name + '.int8.ts'))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
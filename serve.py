@@ -0,0 +1,216 @@
+"""Local inference server with dynamic micro-batching.
+
+Concurrent single-image requests are coalesced into batches of up to
+``--max-batch-size`` images, waiting at most ``--max-wait-ms`` after the first
+one arrives. Each batch runs in a single worker thread under
+``torch.inference_mode()``, so the event loop keeps accepting requests.
+
+Protocol (HTTP/1.1, keep-alive):
+    POST /predict   body: one 28x28 uint8 image, 784 raw bytes, row-major
+                    reply: {"label": 7, "confidence": 0.998}
+    GET  /stats     batch-size histogram since startup
+    GET  /health
+
+    python serve.py checkpoints/MAGE_CNN.pt --port 8000 --max-batch-size 64 --max-wait-ms 2
+    python serve.py exported/MAGE_CNN.ts --unix /tmp/mnist.sock
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from models import load_model
+
+IMAGE_BYTES = 28 * 28
+# Same normalization as mnist_data.normalize, without importing torchvision
+MEAN = 0.5
+STD = 0.5
+
+
+def load_for_serving(path, device='cpu'):
+    """A ``models.save_model`` checkpoint or a TorchScript artifact from ``export.py``."""
+    if path.endswith('.ts'):
+        return torch.jit.load(path, map_location=device).eval()
+    return load_model(path).to(device)
+
+
+class MicroBatcher:
+    """Collects single images from many coroutines and runs them as one batch."""
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=2.0, device='cpu'):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.device = torch.device(device)
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batch_sizes = collections.Counter()
+
+    async def predict(self, image):
+        """``image`` is a uint8 tensor of 784 pixels; returns ``(label, confidence)``."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _forward(self, images):
+        with torch.inference_mode():
+            inputs = images.view(-1, 1, 28, 28).to(self.device).float().div_(255).sub_(MEAN).div_(STD)
+            confidences, labels = torch.softmax(self.model(inputs).float(), dim=1).max(1)
+        return labels.tolist(), confidences.tolist()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Any failure is handed to this batch's requests; the loop keeps serving later ones
+            try:
+                self.batch_sizes[len(batch)] += 1
+                images = torch.stack([image for image, _ in batch])
+                labels, confidences = await loop.run_in_executor(self.executor, self._forward, images)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), label, confidence in zip(batch, labels, confidences):
+                if not future.done():
+                    future.set_result((label, confidence))
+
+
+def _response(status, body, content_type='application/json'):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    head = 'HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'.format(status, content_type, len(body))
+    return head.encode() + body
+
+
+async def _read_request(reader):
+    """``(method, path, headers, body)``, None at end of stream; ValueError for a malformed request."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError('header too large')
+    lines = head.decode('latin-1').split('\r\n')
+    method, path, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    length = headers.get('content-length', '0')
+    # No endpoint takes more than one image, so larger bodies are refused unread
+    if not length.isdecimal() or int(length) > IMAGE_BYTES:
+        raise ValueError('Content-Length must be an integer from 0 to {}'.format(IMAGE_BYTES))
+    try:
+        body = await reader.readexactly(int(length))
+    except asyncio.IncompleteReadError:
+        raise ValueError('truncated body')
+    return method, path, headers, body
+
+
+def make_handler(batcher):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError as exc:
+                    # Framing is lost after a bad request, so the connection is closed after the reply
+                    writer.write(_response('400 Bad Request', {'error': 'malformed request: {}'.format(exc)}))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if method == 'POST' and path == '/predict':
+                    if len(body) != IMAGE_BYTES:
+                        reply = _response('400 Bad Request', {'error': 'expected {} bytes'.format(IMAGE_BYTES)})
+                    else:
+                        image = torch.frombuffer(bytearray(body), dtype=torch.uint8)
+                        try:
+                            label, confidence = await batcher.predict(image)
+                            reply = _response('200 OK', {'label': label, 'confidence': confidence})
+                        except Exception as exc:
+                            reply = _response('500 Internal Server Error', {'error': str(exc)})
+                elif method == 'GET' and path == '/stats':
+                    reply = _response('200 OK', {'batch_sizes': dict(sorted(batcher.batch_sizes.items()))})
+                elif method == 'GET' and path == '/health':
+                    reply = _response('200 OK', {'status': 'ok'})
+                else:
+                    reply = _response('404 Not Found', {'error': 'not found'})
+                writer.write(reply)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(model, host='127.0.0.1', port=8000, unix_path=None, max_batch_size=64, max_wait_ms=2.0,
+                device='cpu'):
+    batcher = MicroBatcher(model, max_batch_size, max_wait_ms, device)
+    handler = make_handler(batcher)
+    if unix_path:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+    else:
+        server = await asyncio.start_server(handler, host, port)
+    worker = asyncio.ensure_future(batcher.run())
+    print('serving on {} (max batch {}, max wait {} ms)'.format(
+        unix_path or '{}:{}'.format(host, port), max_batch_size, max_wait_ms), flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        worker.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-batching inference server for a trained model.')
+    parser.add_argument('model', help='models.save_model checkpoint (.pt) or TorchScript artifact (.ts)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=64, help='1 disables batching')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_for_serving(args.model, args.device)
+    try:
+        asyncio.run(serve(model, args.host, args.port, args.unix, args.max_batch_size, args.max_wait_ms,
+                          args.device))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Hyperparameter sweep with successive-halving early termination.
+
+``sweep`` samples ``num_trials`` configs from an architecture's search space
+and trains them in rungs: every live trial is trained up to the rung's epoch
+budget on a process pool, then only the best ``1/eta`` by val accuracy move
+on to the next rung. Trials resume where they stopped from their own
+``CheckpointManager`` directory, so a promoted trial never repeats an epoch.
+
+    python sweep.py --model MAGE_CNN --trials 27 --workers 3 --output sweeps/mage.csv
+
+With ``--min-epochs 1 --eta 3 --max-epochs 10`` the rungs are 1, 3, 9 and
+10 epochs; 27 trials cost 27 + 18 + 18 + 1 = 64 epochs instead of 270.
+"""
+
+import argparse
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from torch import nn, optim
+
+from checkpoint import CheckpointManager
+from mnist_data import build_loaders, prepare_cache
+from models import MODELS
+from parallel_runner import DEFAULT_CONFIG, available_cores, partition_cores
+from training import Trainer
+
+# Values tried per hyperparameter; the notebook's choice is always included
+BASE_SPACE = {
+    'lr': [3e-4, 1e-3, 3e-3],
+    'batch_size': [32, 64, 128],
+    'step_size': [3, 5, 8],
+    'gamma': [0.1, 0.3, 0.5],
+}
+
+# Per-architecture additions: only MAGE_CNN can train on masked inputs (the
+# notebook trains it unmasked)
+SEARCH_SPACES = {
+    'CNNFramework': BASE_SPACE,
+    'BranchingMergingCNN': BASE_SPACE,
+    'MAGE_CNN': dict(BASE_SPACE, use_mask=[False, True], mask_ratio=[0.1, 0.2, 0.3]),
+}
+
+COLUMNS = ['trial', 'model', 'lr', 'batch_size', 'step_size', 'gamma', 'use_mask', 'mask_ratio',
+           'epochs', 'best_val_acc', 'last_val_acc', 'train_time', 'status']
+
+
+def sample_configs(space, num_trials, seed=0):
+    """``num_trials`` distinct configs drawn from ``space`` (fewer if the grid is smaller).
+
+    ``mask_ratio`` only matters with ``use_mask``; unmasked configs carry
+    ``mask_ratio=None`` so they are not tried once per ratio.
+    """
+    grid = []
+    for choice in itertools.product(*space.values()):
+        config = dict(DEFAULT_CONFIG, **dict(zip(space, choice)))
+        if not config['use_mask']:
+            config['mask_ratio'] = None
+        if config not in grid:
+            grid.append(config)
+    return random.Random(seed).sample(grid, min(num_trials, len(grid)))
+
+
+def rungs(min_epochs, max_epochs, eta):
+    """Epoch budgets ``min_epochs * eta**k``, capped by (and ending at) ``max_epochs``."""
+    budgets = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        budgets.append(epochs)
+        epochs *= eta
+    return budgets + [max_epochs]
+
+
+def _pin_worker(groups):
+    # Each pool worker takes one core slice for its lifetime
+    cores = groups.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+
+def run_trial(model_name, config, num_epochs, directory):
+    """Train (or keep training) one trial up to ``num_epochs``; returns its history and timing."""
+    torch.manual_seed(config['seed'])
+    dataloaders, _, _ = build_loaders(mode='mmap', batch_size=config['batch_size'])
+    model = MODELS[model_name]()
+    optimizer = optim.AdamW(model.parameters(), lr=config['lr'])
+    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=config['step_size'], gamma=config['gamma'])
+    checkpoint = CheckpointManager(directory, keep_best=1)
+    trainer = Trainer(model, nn.CrossEntropyLoss(), optimizer, scheduler, use_mask=config['use_mask'],
+                      mask_ratio=config['mask_ratio'], verbose=False, checkpoint=checkpoint)
+    since = time.time()
+    history = trainer.fit(dataloaders, num_epochs, resume=True)
+    checkpoint.close()
+    return {'history': history, 'train_time': time.time() - since}
+
+
+def sweep(model_name, num_trials=27, min_epochs=1, max_epochs=DEFAULT_CONFIG['num_epochs'], eta=3,
+          num_workers=None, directory='sweeps/', seed=0):
+    """Successive halving over sampled configs; returns one row per trial for the results table."""
+    cores = available_cores()
+    num_workers = num_workers or max(1, len(cores) // 4)
+    configs = sample_configs(SEARCH_SPACES[model_name], num_trials, seed)
+    trials = [{'trial': i, 'model': model_name, 'config': config, 'epochs': 0, 'history': None,
+               'train_time': 0.0, 'status': 'running',
+               'directory': os.path.join(directory, model_name, 'trial_{:03d}'.format(i))}
+              for i, config in enumerate(configs)]
+    for trial in trials:
+        # A stale checkpoint from an earlier sweep would be resumed as if it were this trial
+        shutil.rmtree(trial['directory'], ignore_errors=True)
+
+    context = mp.get_context('spawn')
+    groups = context.Queue()
+    for group in partition_cores(cores, [1] * num_workers):
+        groups.put(group)
+    # Build the shared cache once, before the workers map it
+    prepare_cache()
+
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=_pin_worker, initargs=(groups,)) as pool:
+        live = trials
+        for level, budget in enumerate(rungs(min_epochs, max_epochs, eta)):
+            futures = [pool.submit(run_trial, model_name, trial['config'], budget, trial['directory'])
+                       for trial in live]
+            for trial, future in zip(live, futures):
+                result = future.result()
+                trial['history'] = result['history']
+                trial['train_time'] += result['train_time']
+                trial['epochs'] = budget
+            print('rung {} ({:2d} epochs): {:3d} trials, best val acc {:.4f}'.format(
+                level, budget, len(live), max(max(t['history']['val_acc']) for t in live)))
+
+            if budget == max_epochs:
+                for trial in live:
+                    trial['status'] = 'completed'
+                break
+            live.sort(key=lambda t: max(t['history']['val_acc']), reverse=True)
+            keep = max(1, len(live) // eta)
+            for trial in live[keep:]:
+                trial['status'] = 'stopped@{}'.format(budget)
+            live = live[:keep]
+
+    return [_row(trial) for trial in trials]
+
+
+def _row(trial):
+    config, history = trial['config'], trial['history']
+    row = {key: config[key] for key in COLUMNS if key in config}
+    row.update(trial=trial['trial'], model=trial['model'], epochs=trial['epochs'],
+               best_val_acc=max(history['val_acc']), last_val_acc=history['val_acc'][-1],
+               train_time=round(trial['train_time'], 1), status=trial['status'])
+    return row
+
+
+def write_table(path, rows):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', default='CNNFramework', choices=list(MODELS))
+    parser.add_argument('--trials', type=int, default=27)
+    parser.add_argument('--min-epochs', type=int, default=1)
+    parser.add_argument('--max-epochs', type=int, default=DEFAULT_CONFIG['num_epochs'])
+    parser.add_argument('--eta', type=int, default=3, help='keep the best 1/eta trials per rung')
+    parser.add_argument('--workers', type=int, help='concurrent trials (default: one per 4 cores)')
+    parser.add_argument('--directory', default='sweeps/', help='per-trial checkpoint directories')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results table to this CSV file')
+    args = parser.parse_args()
+
+    rows = sweep(args.model, args.trials, args.min_epochs, args.max_epochs, args.eta, args.workers,
+                 args.directory, args.seed)
+    rows.sort(key=lambda row: (row['epochs'], row['best_val_acc']), reverse=True)
+    print('{:>5} {:>7} {:>5} {:>4} {:>5} {:>5} {:>6} {:>8} {:>8}  {}'.format(
+        'trial', 'lr', 'batch', 'step', 'gamma', 'mask', 'epochs', 'best acc', 'time', 'status'))
+    for row in rows:
+        mask = '{:g}'.format(row['mask_ratio']) if row['use_mask'] else 'off'
+        print('{trial:>5} {lr:>7g} {batch_size:>5} {step_size:>4} {gamma:>5} {mask:>5} {epochs:>6} '
+              '{best_val_acc:>8.4f} {train_time:>7.0f}s  {status}'.format(mask=mask, **row))
+    spent = sum(row['epochs'] for row in rows)
+    print('{} epochs trained instead of {}'.format(spent, len(rows) * args.max_epochs))
+    if args.output:
+        write_table(args.output, rows)
+
+
+if __name__ == '__main__':
+    main()
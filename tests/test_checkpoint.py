@@ -0,0 +1,38 @@
+import torch
+from torch import nn, optim
+
+from checkpoint import CheckpointManager
+from training import Trainer
+
+
+def _constant_model(predicted_class):
+    # lr=0 keeps the prediction fixed, so each run's val accuracy is known up front
+    model = nn.Sequential(nn.Flatten(), nn.Linear(4, 2))
+    with torch.no_grad():
+        model[1].weight.zero_()
+        model[1].bias.copy_(torch.eye(2)[predicted_class])
+    return model
+
+
+def _fit(directory, predicted_class, num_epochs):
+    model = _constant_model(predicted_class)
+    batch = (torch.randn(4, 1, 2, 2), torch.tensor([0, 0, 0, 1]))
+    checkpoint = CheckpointManager(directory)
+    trainer = Trainer(model, nn.CrossEntropyLoss(), optim.SGD(model.parameters(), lr=0.0), verbose=False,
+                      checkpoint=checkpoint)
+    trainer.fit({'train': [batch], 'val': [batch]}, num_epochs)
+    checkpoint.close()
+
+
+def test_fresh_run_replaces_previous_run(tmp_path):
+    # First run: val acc 0.75 for three epochs; second run: val acc 0.25 for one
+    _fit(str(tmp_path), predicted_class=0, num_epochs=3)
+    _fit(str(tmp_path), predicted_class=1, num_epochs=1)
+
+    checkpoint = CheckpointManager(str(tmp_path))
+    best = checkpoint.load_best()
+    assert best['epoch'] == 0
+    assert best['val_acc'] == 0.25
+    assert torch.equal(best['model']['1.bias'], torch.tensor([0.0, 1.0]))
+    assert sorted(p.name for p in tmp_path.glob('epoch_*.pt')) == ['epoch_0000.pt']
+    checkpoint.close()
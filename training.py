@@ -0,0 +1,306 @@
+"""Training engine shared by every model in ``code.py``.
+
+``Trainer`` replaces the three per-section copies of ``train_model``. Loss and
+correct counts are accumulated in on-device tensors and read once per phase,
+so the hot loop never waits on the host with ``.item()``.
+"""
+
+import time
+
+import torch
+from torch import nn
+
+from augment import MaskAugment
+from checkpoint import CheckpointManager, copy_state
+from evaluation import evaluate
+
+
+class Callback:
+    """Base class for ``Trainer`` callbacks; override the hooks you need."""
+
+    def on_batch_end(self, trainer, step, logs):
+        """After every training step; ``logs['loss']`` is an on-device tensor, don't ``.item()`` it here."""
+        pass
+
+    def on_epoch_end(self, trainer, epoch, logs):
+        pass
+
+    def on_best_model(self, trainer, epoch, val_acc):
+        pass
+
+
+class Trainer:
+    """Train/val loop with best-model selection on val accuracy.
+
+    ``use_mask``/``mask_ratio`` reproduce the MAGE variant: training inputs
+    are multiplied by a random pixel mask sized from each batch. ``augment``
+    takes any callable applied to training batches on the device instead,
+    e.g. a seeded block-mask ``MaskAugment``. With a
+    ``CheckpointManager`` every epoch is saved in the background and
+    ``fit(..., resume=True)`` continues from the latest one; without
+    ``resume`` the directory is cleared first. ``amp_dtype``
+    (e.g. ``torch.bfloat16``) runs forward passes under ``torch.autocast``;
+    weights, optimizer state and the loss stay fp32. ``memory_format=
+    torch.channels_last`` converts the model and every batch to NHWC.
+    With ``distributed=True`` (one process per rank, see ``ddp.py``) the
+    per-phase loss and accuracy are summed over all ranks before they are
+    read, so every rank logs and selects on the global metrics. A
+    ``profiling.LayerProfiler`` passed as ``profiler`` also gets every
+    loader wrapped so it can split data-loading from compute time. Batches
+    may carry extra tensors after the labels; they are passed on to
+    ``criterion(outputs, labels, *extras)``.
+    """
+
+    def __init__(self, model, criterion, optimizer, scheduler=None, device=None,
+                 use_mask=False, mask_ratio=0.2, callbacks=(), verbose=True, checkpoint=None,
+                 amp_dtype=None, memory_format=None, distributed=False, augment=None,
+                 profiler=None):
+        self.model = model
+        self.criterion = criterion
+        self.optimizer = optimizer
+        self.scheduler = scheduler
+        self.device = device if device is not None else next(model.parameters()).device
+        self.use_mask = use_mask
+        self.mask_ratio = mask_ratio
+        if augment is None and use_mask:
+            augment = MaskAugment(mask_ratio)
+        self.augment = augment
+        self.profiler = profiler
+        self.callbacks = list(callbacks)
+        self.verbose = verbose
+        self.checkpoint = checkpoint
+        self.amp_dtype = amp_dtype
+        self.distributed = distributed
+        self.memory_format = memory_format or torch.contiguous_format
+        if memory_format is not None:
+            # In place on the parameters, so the optimizer keeps tracking them
+            model.to(memory_format=memory_format)
+        self.history = {'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': []}
+        self.best_acc = 0.0
+        self.step = 0
+        self._best_state = None
+
+    def _log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def run_epoch(self, loader, train):
+        """One pass over ``loader``; returns ``(mean loss, accuracy)``."""
+        model = self.model
+        model.train(train)
+        running_loss = torch.zeros((), device=self.device)
+        running_corrects = torch.zeros((), dtype=torch.long, device=self.device)
+        total = 0
+        if self.profiler is not None:
+            loader = self.profiler.time_loader(loader, 'train' if train else 'eval')
+
+        for inputs, labels, *extras in loader:
+            inputs = inputs.to(self.device, non_blocking=True, memory_format=self.memory_format)
+            labels = labels.to(self.device, non_blocking=True)
+            extras = [extra.to(self.device, non_blocking=True) for extra in extras]
+
+            if train and self.augment is not None:
+                inputs = self.augment(inputs)
+
+            with torch.set_grad_enabled(train):
+                with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None):
+                    outputs = model(inputs)
+                loss = self.criterion(outputs.float(), labels, *extras)
+
+            if train:
+                self.optimizer.zero_grad(set_to_none=True)
+                loss.backward()
+                self.optimizer.step()
+                self.step += 1
+                for callback in self.callbacks:
+                    callback.on_batch_end(self, self.step, {'loss': loss.detach()})
+
+            running_loss += loss.detach() * inputs.size(0)
+            running_corrects += (outputs.argmax(1) == labels).sum()
+            total += inputs.size(0)
+
+        if self.distributed:
+            stats = torch.stack([running_loss.double(), running_corrects.double(),
+                                 torch.tensor(total, dtype=torch.float64, device=self.device)])
+            torch.distributed.all_reduce(stats)
+            loss_sum, corrects, total = stats.tolist()
+            return loss_sum / total, corrects / total
+
+        # The only host synchronisation of the phase
+        return running_loss.item() / total, running_corrects.item() / total
+
+    def _resume(self):
+        state = self.checkpoint.load_latest()
+        if state is None:
+            return 0
+        self.model.load_state_dict(state['model'])
+        if state['optimizer'] is not None:
+            self.optimizer.load_state_dict(state['optimizer'])
+        if self.scheduler is not None and state['scheduler'] is not None:
+            self.scheduler.load_state_dict(state['scheduler'])
+        self.history = state['history']
+        torch.set_rng_state(state['rng_state'])
+
+        best = self.checkpoint.load_best()
+        if best is not None:
+            self.best_acc = best['val_acc']
+            self._best_state = copy_state(best['model'], self._best_state)
+        self._log('Resumed from epoch {}'.format(state['epoch']))
+        return state['epoch'] + 1
+
+    def fit(self, dataloaders, num_epochs, resume=False):
+        """Train up to ``num_epochs`` and leave the best-val weights loaded."""
+        since = time.time()
+        # Best weights live in preallocated CPU buffers, refreshed in place
+        self._best_state = copy_state(self.model.state_dict(), self._best_state)
+        start_epoch = 0
+        if self.checkpoint is not None:
+            if resume:
+                start_epoch = self._resume()
+            else:
+                # A fresh run must not inherit (or be pruned against) an earlier run's best epochs
+                self.checkpoint.reset()
+
+        for epoch in range(start_epoch, num_epochs):
+            self._log('Epoch {}/{}'.format(epoch, num_epochs - 1))
+            self._log('-' * 10)
+            # DistributedSampler reshuffles per epoch only when told the epoch
+            sampler = getattr(dataloaders['train'], 'sampler', None)
+            if hasattr(sampler, 'set_epoch'):
+                sampler.set_epoch(epoch)
+
+            for phase in ['train', 'val']:
+                epoch_loss, epoch_acc = self.run_epoch(dataloaders[phase], phase == 'train')
+                if phase == 'train' and self.scheduler is not None:
+                    self.scheduler.step()
+
+                self._log('{} Loss: {:.4f} Acc: {:.4f}'.format(phase, epoch_loss, epoch_acc))
+                self.history[phase + '_loss'].append(epoch_loss)
+                self.history[phase + '_acc'].append(epoch_acc)
+
+            val_acc = self.history['val_acc'][-1]
+            if val_acc > self.best_acc:
+                self.best_acc = val_acc
+                self._best_state = copy_state(self.model.state_dict(), self._best_state)
+                for callback in self.callbacks:
+                    callback.on_best_model(self, epoch, val_acc)
+
+            if self.checkpoint is not None:
+                self.checkpoint.save(epoch, self.model, self.optimizer, self.scheduler, self.history, val_acc)
+
+            logs = {key: values[-1] for key, values in self.history.items()}
+            for callback in self.callbacks:
+                callback.on_epoch_end(self, epoch, logs)
+            self._log()
+
+        if self.checkpoint is not None:
+            self.checkpoint.wait()
+
+        time_elapsed = time.time() - since
+        self._log('Training complete in {:.0f}m {:.0f}s'.format(time_elapsed // 60, time_elapsed % 60))
+        self._log('Best val Acc: {:4f}'.format(self.best_acc))
+
+        self.model.load_state_dict(self._best_state)
+        return self.history
+
+    def evaluate(self, loader):
+        """Top-1 accuracy of the current weights on ``loader``."""
+        with torch.no_grad():
+            _, acc = self.run_epoch(loader, train=False)
+        return acc
+
+
+def train_model(model, criterion, optimizer, scheduler, dataset_sizes, dataloaders, num_epochs, testloader,
+                use_mask=False, mask_ratio=0.2, callbacks=(), checkpoint_dir=None, resume=False,
+                keep_best=3, amp_dtype=None, memory_format=None, augment=None, profiler=None,
+                eval_batch_size=1024):
+    """The notebook-facing entry point: returns ``(model, history, [test_acc])``.
+
+    ``dataset_sizes`` is accepted for compatibility; sample counts are taken
+    from the batches themselves. With ``checkpoint_dir`` every epoch is
+    checkpointed there, and ``resume=True`` picks up from the latest one.
+    ``amp_dtype=torch.bfloat16`` enables CPU/GPU mixed precision and
+    ``memory_format=torch.channels_last`` NHWC convolutions. With a
+    ``profiler`` its per-layer report is printed after the test pass.
+    The test pass is a single ``evaluation.evaluate`` pass at
+    ``eval_batch_size``; its full report is kept as ``history['test_report']``.
+    """
+    checkpoint = CheckpointManager(checkpoint_dir, keep_best) if checkpoint_dir else None
+    trainer = Trainer(model, criterion, optimizer, scheduler, use_mask=use_mask, mask_ratio=mask_ratio,
+                      callbacks=callbacks, checkpoint=checkpoint, amp_dtype=amp_dtype,
+                      memory_format=memory_format, augment=augment, profiler=profiler)
+    history = trainer.fit(dataloaders, num_epochs, resume=resume)
+    if checkpoint is not None:
+        checkpoint.close()
+
+    report = evaluate(model, testloader, trainer.device, eval_batch_size, amp_dtype=amp_dtype,
+                      memory_format=trainer.memory_format)
+    history['test_report'] = report
+    test_acc = report['accuracy']
+    print('Test Accuracy: {:.4f}  Top-3: {:.4f}  ECE: {:.4f}'.format(test_acc, report['top_k'][3], report['ece']))
+    if profiler is not None:
+        print(profiler.report())
+
+    return model, history, [test_acc]
+
+
+def _legacy_steps(model, criterion, optimizer, batches):
+    # Body of the old per-section train_model: zero_grad() + .item() every step
+    model.train()
+    running_loss = 0.0
+    running_corrects = 0
+    for inputs, labels in batches:
+        optimizer.zero_grad()
+        outputs = model(inputs)
+        _, preds = torch.max(outputs, 1)
+        loss = criterion(outputs, labels)
+        loss.backward()
+        optimizer.step()
+        running_loss += loss.item() * inputs.size(0)
+        running_corrects += torch.sum(preds == labels.data)
+    return running_loss, running_corrects
+
+
+# Trainer keyword arguments per benchmarked configuration; None is the legacy loop
+STEP_CONFIGS = {
+    'legacy': None,
+    'trainer': {},
+    'channels_last': {'memory_format': torch.channels_last},
+}
+
+
+def benchmark_steps(model_cls, batches, configs=STEP_CONFIGS, repeats=3):
+    """Training steps/sec of each configuration on pre-loaded ``batches``."""
+    results = {}
+    for name, kwargs in configs.items():
+        best = float('inf')
+        for _ in range(repeats):
+            torch.manual_seed(0)
+            model = model_cls()
+            optimizer = torch.optim.AdamW(model.parameters(), lr=0.001)
+            criterion = nn.CrossEntropyLoss()
+            if kwargs is not None:
+                trainer = Trainer(model, criterion, optimizer, verbose=False, **kwargs)
+            start = time.perf_counter()
+            if kwargs is None:
+                _legacy_steps(model, criterion, optimizer, batches)
+            else:
+                trainer.run_epoch(batches, train=True)
+            best = min(best, time.perf_counter() - start)
+        results[name] = len(batches) / best
+    return results
+
+
+if __name__ == '__main__':
+    import itertools
+
+    from mnist_data import build_loaders
+    from models import BranchingMergingCNN, CNNFramework, MAGE_CNN
+
+    dataloaders, _, _ = build_loaders(mode='mmap')
+    batches = list(itertools.islice(dataloaders['train'], 100))
+    for model_cls in [CNNFramework, BranchingMergingCNN, MAGE_CNN]:
+        results = benchmark_steps(model_cls, batches)
+        print('{:<20} '.format(model_cls.__name__) + '  '.join(
+            '{} {:7.1f} steps/s ({:+.1%})'.format(name, rate, rate / results['legacy'] - 1)
+            for name, rate in results.items()))